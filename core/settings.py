@@ -116,6 +116,9 @@ if ENVIRONMENT == "production":
             "PASSWORD": env("DATABASE_PASSWORD"),
             "HOST": env("DATABASE_HOST"),
             "PORT": env("DATABASE_PORT", default="5432"),
+            "CONN_MAX_AGE": env.int("DATABASE_CONN_MAX_AGE", default=60),
+            "CONN_HEALTH_CHECKS": True,
+            "DISABLE_SERVER_SIDE_CURSORS": env.bool("DATABASE_DISABLE_SERVER_SIDE_CURSORS", default=False),
         }
     }
 else:
@@ -154,6 +157,8 @@ STRIPE_PUBLIC_KEY = env("STRIPE_PUBLIC_KEY", default="")
 STRIPE_SECRET_KEY = env("STRIPE_SECRET_KEY", default="")
 STRIPE_WEBHOOK_SECRET = env("STRIPE_WEBHOOK_SECRET", default="")
 
+OTP_HMAC_PEPPER = env("OTP_HMAC_PEPPER", default=SECRET_KEY)
+
 FRONTEND_RESET_PASSWORD_URL = env("FRONTEND_RESET_PASSWORD_URL", default="http://127.0.0.1:8000/")
 
 CORS_ALLOW_CREDENTIALS = True
@@ -0,0 +1,20 @@
+import threading
+
+from django.db import transaction
+
+
+def _delete_files(storage, names):
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            pass
+
+
+def delete_files_on_commit(storage, names):
+    names = [name for name in names if name]
+    if not storage or not names:
+        return
+    transaction.on_commit(
+        lambda: threading.Thread(target=_delete_files, args=(storage, names), daemon=True).start()
+    )
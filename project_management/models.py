@@ -8,7 +8,7 @@ from django.core.validators import (
     FileExtensionValidator,
     MinValueValidator,
 )
-from django.db.models import Q, F, Sum
+from django.db.models import Count, Q, F, Sum
 from django.core.exceptions import ValidationError
 
 from professional.models import Professional
@@ -192,6 +192,7 @@ class Member(models.Model):
     )
     title = models.CharField(max_length=120, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["full_name"]
@@ -267,6 +268,7 @@ class ProjectMember(models.Model):
     role = models.CharField(max_length=20, choices=Role.choices, default=Role.OTHER)
     is_active = models.BooleanField(default=True)
     joined_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = [("project", "member")]
@@ -290,6 +292,14 @@ class ProjectMember(models.Model):
         super().save(*args, **kwargs)
 
 
+class TaskQuerySet(models.QuerySet):
+    def with_counts(self):
+        return self.annotate(
+            comments_count=Count("comments", distinct=True),
+            attachments_count=Count("attachments", distinct=True),
+        )
+
+
 class Task(models.Model):
     class Status(models.TextChoices):
         TODO = ("TODO", "To Do")
@@ -329,6 +339,8 @@ class Task(models.Model):
     )
     parent_task = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="subtasks")
 
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         indexes = [
@@ -338,6 +350,15 @@ class Task(models.Model):
             models.Index(fields=["due_date"]),
         ]
 
+    @staticmethod
+    def overdue(status, due_date, today=None):
+        today = today or timezone.now().date()
+        return bool(due_date and status != Task.Status.DONE and due_date < today)
+
+    @property
+    def is_overdue(self):
+        return Task.overdue(self.status, self.due_date)
+
     def clean(self):
         _ensure_pm_access(self.project.owner.user)
         creating = self.pk is None
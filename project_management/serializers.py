@@ -79,6 +79,10 @@ class TaskSerializer(serializers.ModelSerializer):
     created_by_id = serializers.PrimaryKeyRelatedField(
         queryset=ProjectMember.objects.all(), write_only=True, required=False, allow_null=True, source="created_by"
     )
+    is_overdue = serializers.BooleanField(read_only=True)
+    # Annotated by Task.objects.with_counts(); a task that was just created has none.
+    comments_count = serializers.IntegerField(read_only=True, default=0)
+    attachments_count = serializers.IntegerField(read_only=True, default=0)
 
     class Meta:
         model = Task
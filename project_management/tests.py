@@ -1,3 +1,90 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from professional.models import Professional
+
+from .models import Project, Task, TaskAttachment, TaskComment
+from .views import ProjectViewSet, TaskViewSet
+
+User = get_user_model()
+
+
+class TaskListConditionalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="pm@example.com", password="pw-12345678")
+        owner = Professional.objects.create(user=self.user, license_number="LIC-1")
+        # bulk_create skips the subscription checks in Project/Task.save().
+        [self.project] = Project.objects.bulk_create([Project(name="Kitchen", owner=owner)])
+        [self.task] = Task.objects.bulk_create([Task(title="Demolition", project=self.project)])
+        self.view = ProjectViewSet.as_view({"get": "list_tasks"})
+
+    def _get(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        request = APIRequestFactory().get("/", headers=headers)
+        force_authenticate(request, user=self.user)
+        return self.view(request, pk=self.project.pk)
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self._get()["ETag"]
+        self.assertEqual(self._get(etag).status_code, 304)
+
+    def test_if_modified_since_is_not_honoured(self):
+        response = self._get()
+        self.assertNotIn("Last-Modified", response)
+        request = APIRequestFactory().get("/", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+        force_authenticate(request, user=self.user)
+        self.assertEqual(self.view(request, pk=self.project.pk).status_code, 200)
+
+    def test_new_comment_changes_etag(self):
+        etag = self._get()["ETag"]
+        TaskComment.objects.create(task=self.task, content="Started")
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["comments_count"], 1)
+
+    def test_removed_attachment_changes_etag(self):
+        [attachment] = TaskAttachment.objects.bulk_create(
+            [TaskAttachment(task=self.task, file="task_attachments/plan.pdf", filename="plan.pdf")]
+        )
+        etag = self._get()["ETag"]
+        TaskAttachment.objects.filter(pk=attachment.pk).delete()
+        response = self._get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["attachments_count"], 0)
+
+    def test_new_day_changes_etag(self):
+        etag = self._get()["ETag"]
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch("project_management.views.timezone.now", return_value=tomorrow):
+            self.assertEqual(self._get(etag).status_code, 200)
+
+
+class TaskDerivedFieldsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="pm@example.com", password="pw-12345678")
+        owner = Professional.objects.create(user=self.user, license_number="LIC-1")
+        [self.project] = Project.objects.bulk_create([Project(name="Kitchen", owner=owner)])
+        yesterday = timezone.now().date() - timedelta(days=1)
+        [self.task] = Task.objects.bulk_create([Task(title="Demolition", project=self.project, due_date=yesterday)])
+        TaskComment.objects.create(task=self.task, content="Started")
+
+    def _call(self, viewset, actions, **kwargs):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.user)
+        return viewset.as_view(actions)(request, **kwargs)
+
+    def test_list_and_detail_agree(self):
+        [listed] = self._call(ProjectViewSet, {"get": "list_tasks"}, pk=self.project.pk).data
+        detail = self._call(TaskViewSet, {"get": "retrieve"}, pk=self.task.pk).data
+        for field in ("is_overdue", "comments_count", "attachments_count"):
+            self.assertEqual(listed[field], detail[field], field)
+        self.assertEqual((detail["is_overdue"], detail["comments_count"], detail["attachments_count"]), (True, 1, 0))
 
-# Create your tests here.
+    def test_done_task_is_not_overdue(self):
+        Task.objects.filter(pk=self.task.pk).update(status=Task.Status.DONE)
+        self.assertFalse(Task.objects.get(pk=self.task.pk).is_overdue)
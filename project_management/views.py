@@ -1,5 +1,9 @@
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -24,6 +28,91 @@ def _get_professional_or_400(user):
     return user.professional_profile
 
 
+_MEMBER_FIELDS = ("id", "full_name", "email", "phone", "title", "notes")
+_PROJECT_MEMBER_FIELDS = ("id", "project", "role", "is_active", "joined_at")
+_TASK_FIELDS = (
+    "id", "title", "description", "project", "status", "priority",
+    "due_date", "created_at", "updated_at", "parent_task",
+)
+
+
+def _project_member_columns(prefix=""):
+    return (
+        [f"{prefix}{f}" for f in _PROJECT_MEMBER_FIELDS]
+        + [f"{prefix}member__{f}" for f in _MEMBER_FIELDS]
+    )
+
+
+def _nest_project_member(row, prefix=""):
+    if row[f"{prefix}id"] is None:
+        return None
+    return {
+        "id": row[f"{prefix}id"],
+        "project": row[f"{prefix}project"],
+        "member": {f: row[f"{prefix}member__{f}"] for f in _MEMBER_FIELDS},
+        "role": row[f"{prefix}role"],
+        "is_active": row[f"{prefix}is_active"],
+        "joined_at": row[f"{prefix}joined_at"],
+    }
+
+
+def _project_member_rows(qs):
+    return [_nest_project_member(row) for row in qs.values(*_project_member_columns())]
+
+
+def _task_rows(qs):
+    # comments_count, attachments_count and is_overdue are not covered by
+    # Task.updated_at; list_tasks passes related=/daily= so its ETag tracks them.
+    today = timezone.now().date()
+    rows = qs.with_counts().values(
+        *_TASK_FIELDS,
+        *_project_member_columns("assignee__"),
+        *_project_member_columns("created_by__"),
+        "comments_count",
+        "attachments_count",
+    )
+    data = []
+    for row in rows:
+        item = {f: row[f] for f in ("id", "title", "description", "project")}
+        item["assignee"] = _nest_project_member(row, "assignee__")
+        item.update({f: row[f] for f in ("status", "priority", "due_date", "created_at", "updated_at")})
+        item["created_by"] = _nest_project_member(row, "created_by__")
+        item["parent_task"] = row["parent_task"]
+        item["is_overdue"] = Task.overdue(row["status"], row["due_date"], today)
+        item["comments_count"] = row["comments_count"]
+        item["attachments_count"] = row["attachments_count"]
+        data.append(item)
+    return data
+
+
+def _conditional_list(request, qs, render, *timestamp_fields, related=(), daily=False):
+    # related: (queryset, timestamp field) pairs whose rows feed counts in the
+    # payload; daily: the payload also depends on today's date (is_overdue).
+    aggregates = {f"m{i}": Max(field) for i, field in enumerate(timestamp_fields)}
+    agg = qs.aggregate(n=Count("pk"), **aggregates)
+    counts = [agg["n"]]
+    stamps = [agg[key] for key in aggregates if agg[key] is not None]
+    for related_qs, field in related:
+        rel = related_qs.aggregate(n=Count("pk"), m=Max(field))
+        counts.append(rel["n"])
+        if rel["m"] is not None:
+            stamps.append(rel["m"])
+    if daily:
+        stamps.append(timezone.now().replace(hour=0, minute=0, second=0, microsecond=0))
+    newest = max(stamps).timestamp() if stamps else 0
+    etag = quote_etag("-".join(str(part) for part in (*counts, newest)))
+
+    # ETag only: max(updated_at) can move backwards when the newest row is
+    # deleted or hidden, so If-Modified-Since would answer with a stale 304.
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    response = Response(render(qs))
+    response["ETag"] = etag
+    return response
+
+
 class MemberViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Member.objects.all().order_by("full_name")
@@ -48,11 +137,12 @@ class ProjectViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"], url_path="add-member")
     @transaction.atomic
     def add_member(self, request, pk=None):
-        project = self.get_object()
+        if not self.get_queryset().filter(pk=pk).exists():
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
         serializer = ProjectMemberSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         ProjectMember.objects.create(
-            project=project,
+            project_id=pk,
             member=serializer.validated_data["member"],
             role=serializer.validated_data.get("role") or ProjectMember.Role.OTHER,
             is_active=serializer.validated_data.get("is_active", True),
@@ -62,26 +152,39 @@ class ProjectViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["post"], url_path="remove-member")
     @transaction.atomic
     def remove_member(self, request, pk=None):
-        project = self.get_object()
         member_id = request.data.get("member_id")
         if not member_id:
             return Response({"detail": "member_id is required."}, status=status.HTTP_400_BAD_REQUEST)
-        ProjectMember.objects.filter(project=project, member_id=member_id).delete()
+        deleted, _ = ProjectMember.objects.filter(
+            project_id=pk,
+            project__owner=getattr(request.user, "professional_profile", None),
+            member_id=member_id,
+        ).delete()
+        if not deleted:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
         return Response({"detail": "Member removed."}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["get"], url_path="members")
     def list_members(self, request, pk=None):
         project = self.get_object()
-        qs = ProjectMember.objects.select_related("member").filter(project=project).order_by("member__full_name")
-        data = ProjectMemberSerializer(qs, many=True).data
-        return Response(data)
+        qs = ProjectMember.objects.filter(project=project).order_by("member__full_name")
+        return _conditional_list(request, qs, _project_member_rows, "updated_at", "member__updated_at")
 
     @action(detail=True, methods=["get"], url_path="tasks")
     def list_tasks(self, request, pk=None):
         project = self.get_object()
-        qs = Task.objects.select_related("assignee", "created_by").filter(project=project).order_by("-created_at")
-        data = TaskSerializer(qs, many=True).data
-        return Response(data)
+        qs = Task.objects.filter(project=project).order_by("-created_at")
+        return _conditional_list(
+            request, qs, _task_rows,
+            "updated_at",
+            "assignee__updated_at", "assignee__member__updated_at",
+            "created_by__updated_at", "created_by__member__updated_at",
+            related=(
+                (TaskComment.objects.filter(task__project=project), "updated_at"),
+                (TaskAttachment.objects.filter(task__project=project), "uploaded_at"),
+            ),
+            daily=True,
+        )
 
 
 class ProjectMemberViewSet(viewsets.ModelViewSet):
@@ -102,7 +205,7 @@ class ProjectMemberViewSet(viewsets.ModelViewSet):
 
 class TaskViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Task.objects.select_related("project", "assignee", "created_by")
+    queryset = Task.objects.select_related("project", "assignee", "created_by").with_counts()
     serializer_class = TaskSerializer
 
     def get_queryset(self):
@@ -164,8 +267,8 @@ class TaskViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"], url_path="members")
     def task_members(self, request, pk=None):
         task = self.get_object()
-        qs = ProjectMember.objects.select_related("member").filter(project=task.project).order_by("member__full_name")
-        return Response(ProjectMemberSerializer(qs, many=True).data)
+        qs = ProjectMember.objects.filter(project_id=task.project_id).order_by("member__full_name")
+        return _conditional_list(request, qs, _project_member_rows, "updated_at", "member__updated_at")
 
 
 class TaskCommentViewSet(viewsets.ModelViewSet):
@@ -1,11 +1,21 @@
 from django.contrib import admin, messages
-from django.utils.html import format_html
+from django.utils.html import escape, format_html
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from django.urls import path
 from django.http import HttpResponseRedirect
+from django.utils import timezone
 
-from .models import AppSettings
+from core.storage import delete_files_on_commit
+from .models import AppSettings, HEX_COLOR_RE
+
+_THEME_PREVIEW_TMPL = (
+    '<div style="display:flex;gap:12px;align-items:center;font-family:{font};">'
+    '<div style="width:28px;height:28px;background:{primary};border-radius:6px;border:1px solid #e5e7eb;"></div>'
+    '<div style="width:28px;height:28px;background:{secondary};border-radius:6px;border:1px solid #e5e7eb;"></div>'
+    '<span style="opacity:.75;">{primary} / {secondary}</span>'
+    '</div>'
+)
 
 
 @admin.register(AppSettings)
@@ -124,17 +134,10 @@ class AppSettingsAdmin(admin.ModelAdmin):
 
     @admin.display(description=_("Theme preview"))
     def theme_preview(self, obj):
-        primary = obj.primary_color or "#0ea5e9"
-        secondary = obj.secondary_color or "#1f2937"
-        font = obj.font_family or "system-ui"
-        html = f"""
-        <div style="display:flex;gap:12px;align-items:center;font-family:{font};">
-          <div style="width:28px;height:28px;background:{primary};border-radius:6px;border:1px solid #e5e7eb;"></div>
-          <div style="width:28px;height:28px;background:{secondary};border-radius:6px;border:1px solid #e5e7eb;"></div>
-          <span style="opacity:.75;">{primary} / {secondary}</span>
-        </div>
-        """
-        return mark_safe(html)
+        primary = obj.primary_color if HEX_COLOR_RE.fullmatch(obj.primary_color or "") else "#0ea5e9"
+        secondary = obj.secondary_color if HEX_COLOR_RE.fullmatch(obj.secondary_color or "") else "#1f2937"
+        font = escape(obj.font_family or "system-ui")
+        return mark_safe(_THEME_PREVIEW_TMPL.format(primary=primary, secondary=secondary, font=font))
 
     @admin.action(description=_("Toggle maintenance mode"))
     def toggle_maintenance(self, request, queryset):
@@ -151,34 +154,19 @@ class AppSettingsAdmin(admin.ModelAdmin):
             obj.bump_version()
         messages.success(request, _("Version bumped."))
 
+    def _clear_file_field(self, queryset, field_name):
+        with_file = queryset.exclude(**{f"{field_name}__isnull": True}).exclude(**{field_name: ""})
+        names = list(with_file.values_list(field_name, flat=True))
+        cleared = with_file.update(**{field_name: None, "updated_at": timezone.now()})
+        delete_files_on_commit(AppSettings._meta.get_field(field_name).storage, names)
+        return cleared
+
     @admin.action(description=_("Clear logo"))
     def clear_logo(self, request, queryset):
-        cleared = 0
-        for obj in queryset:
-            if obj.logo:
-                storage, name = obj.logo.storage, obj.logo.name
-                obj.logo.delete(save=False)
-                obj.save(update_fields=["logo", "updated_at"])
-                try:
-                    if storage and name:
-                        storage.delete(name)
-                except Exception:
-                    pass
-                cleared += 1
+        cleared = self._clear_file_field(queryset, "logo")
         messages.success(request, _(f"Cleared logo for {cleared} record(s)."))
 
     @admin.action(description=_("Clear favicon"))
     def clear_favicon(self, request, queryset):
-        cleared = 0
-        for obj in queryset:
-            if obj.favicon:
-                storage, name = obj.favicon.storage, obj.favicon.name
-                obj.favicon.delete(save=False)
-                obj.save(update_fields=["favicon", "updated_at"])
-                try:
-                    if storage and name:
-                        storage.delete(name)
-                except Exception:
-                    pass
-                cleared += 1
-        messages.success(request, _(f"Cleared favicon for {cleared} record(s)."))
\ No newline at end of file
+        cleared = self._clear_file_field(queryset, "favicon")
+        messages.success(request, _(f"Cleared favicon for {cleared} record(s)."))
@@ -1,3 +1,4 @@
+import re
 from uuid import uuid4
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, EmailValidator, URLValidator
@@ -5,12 +6,15 @@ from django.db import models
 from django.utils import timezone
 
 
+HEX_COLOR_RE = re.compile(r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
+_hex_color_validator = RegexValidator(regex=HEX_COLOR_RE)
+
+
 def validate_hex_color(value: str):
     if value is None:
         return
     value = value.strip()
-    hex_re = RegexValidator(regex=r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
-    hex_re(value)
+    _hex_color_validator(value)
 
 
 def validate_file_size(file, max_size=5 * 1024 * 1024):
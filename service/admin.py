@@ -1,6 +1,10 @@
 from django.contrib import admin
-from django.utils.html import format_html
-from django.db.models import Avg
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection
+from django.utils.html import format_html, format_html_join
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Substr
+from django.forms.models import BaseInlineFormSet
 
 from .models import (
     ServiceCategory,
@@ -12,6 +16,15 @@ from .models import (
     Rating,
 )
 
+PREVIEW_LENGTH = 50
+_STARS = tuple("⭐" * i for i in range(6))
+
+
+def _preview(text, empty="-"):
+    if not text:
+        return empty
+    return (text[:PREVIEW_LENGTH] + "…") if len(text) > PREVIEW_LENGTH else text
+
 
 @admin.register(ServiceCategory)
 class ServiceCategoryAdmin(admin.ModelAdmin):
@@ -26,29 +39,34 @@ class ServiceCategoryAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related("services")
+        return (
+            qs.annotate(
+                _services_count=Count("services"),
+                _desc_preview=Substr("description", 1, PREVIEW_LENGTH + 1),
+            )
+            .defer("description")
+        )
 
     def photo_thumb(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" style="height:24px;width:auto;border-radius:4px;" />', obj.photo.url)
+            return format_html('<img src="{}" loading="lazy" decoding="async" style="height:24px;width:auto;border-radius:4px;" />', obj.photo.url)
         return "-"
     photo_thumb.short_description = "Photo"
 
     def photo_preview(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" style="max-height:120px;width:auto;border:1px solid #eee;border-radius:6px;padding:4px;" />', obj.photo.url)
+            return format_html('<img src="{}" loading="lazy" decoding="async" style="max-height:120px;width:auto;border:1px solid #eee;border-radius:6px;padding:4px;" />', obj.photo.url)
         return "-"
     photo_preview.short_description = "Preview"
 
     def description_preview(self, obj):
-        if obj.description:
-            return (obj.description[:50] + "…") if len(obj.description) > 50 else obj.description
-        return "-"
+        return _preview(obj._desc_preview)
     description_preview.short_description = "Description"
 
     def services_count(self, obj):
-        return obj.services.count()
+        return obj._services_count
     services_count.short_description = "Services"
+    services_count.admin_order_field = "_services_count"
 
 
 @admin.register(Unit)
@@ -64,11 +82,30 @@ class UnitAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related("services")
+        return qs.annotate(_services_count=Count("services"))
 
     def services_count(self, obj):
-        return obj.services.count()
+        return obj._services_count
     services_count.short_description = "Services"
+    services_count.admin_order_field = "_services_count"
+
+
+class LimitedInlineFormSet(BaseInlineFormSet):
+    limit = None
+
+    def get_queryset(self):
+        if not hasattr(self, "_limited_queryset"):
+            qs = super().get_queryset()
+            self._limited_queryset = qs[: self.limit] if self.limit else qs
+        return self._limited_queryset
+
+
+class ServiceTypeInlineFormSet(LimitedInlineFormSet):
+    limit = 50
+
+
+class RatingInlineFormSet(LimitedInlineFormSet):
+    limit = 25
 
 
 class ServicePhotoInline(admin.TabularInline):
@@ -84,6 +121,7 @@ class ServiceTypeInline(admin.TabularInline):
     readonly_fields = ("created_at",)
     fields = ("title", "description", "price", "created_at")
     show_change_link = True
+    formset = ServiceTypeInlineFormSet
 
 
 class RatingInline(admin.TabularInline):
@@ -92,6 +130,10 @@ class RatingInline(admin.TabularInline):
     readonly_fields = ("user", "rating", "review", "created_at")
     fields = ("user", "rating", "review", "created_at")
     can_delete = False
+    formset = RatingInlineFormSet
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("user")
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -111,11 +153,10 @@ class ServiceAdmin(admin.ModelAdmin):
     )
     list_filter = ("is_trade_required", "categories", "unit", "created_at")
     search_fields = ("title", "description")
-    filter_horizontal = ("categories",)
     ordering = ("title",)
     readonly_fields = ("created_at", "average_rating_display")
     inlines = [ServiceTypeInline, ServicePhotoInline, RatingInline]
-    autocomplete_fields = ("unit",)
+    autocomplete_fields = ("unit", "categories")
 
     fieldsets = (
         (None, {"fields": ("title", "description")}),
@@ -126,25 +167,44 @@ class ServiceAdmin(admin.ModelAdmin):
     )
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.select_related("unit").prefetch_related("categories", "types")
+        qs = (
+            super().get_queryset(request)
+            .select_related("unit")
+            .annotate(_types_count=Count("types", distinct=True))
+            .defer("description")
+        )
+        if connection.vendor == "postgresql":
+            titles = (
+                Service.categories.through.objects.filter(service_id=OuterRef("pk"))
+                .values("service_id")
+                .annotate(titles=ArrayAgg("servicecategory__title", ordering="servicecategory__title"))
+                .values("titles")
+            )
+            return qs.annotate(_category_titles=Subquery(titles))
+        return qs.prefetch_related(Prefetch("categories", queryset=ServiceCategory.objects.only("id", "title")))
 
     def categories_display(self, obj):
-        names = [c.title for c in obj.categories.all()[:3]]
-        more = obj.categories.count() - len(names)
-        return ", ".join(names) + (f" (+{more})" if more > 0 else "")
+        if hasattr(obj, "_category_titles"):
+            titles = obj._category_titles or []
+        else:
+            titles = [c.title for c in obj.categories.all()]
+        shown = format_html_join(", ", "{}", ((title,) for title in titles[:3]))
+        more = len(titles) - 3
+        return format_html("{} (+{})", shown, more) if more > 0 else shown
     categories_display.short_description = "Categories"
 
     def average_rating_display(self, obj):
         avg = obj.average_rating
         if avg:
-            return format_html("{} {}", avg, "⭐" * int(round(avg)))
+            return format_html("{} {}", avg, _STARS[int(round(avg))])
         return "No ratings"
     average_rating_display.short_description = "Avg Rating"
+    average_rating_display.admin_order_field = "rating_avg"
 
     def types_count(self, obj):
-        return obj.types.count()
+        return obj._types_count
     types_count.short_description = "Types"
+    types_count.admin_order_field = "_types_count"
 
 
 class ServiceTypePhotoInline(admin.TabularInline):
@@ -160,23 +220,31 @@ class ServiceTypeAdmin(admin.ModelAdmin):
     list_filter = ("service", "created_at")
     search_fields = ("title", "description", "service__title")
     ordering = ("service", "title")
+    list_select_related = ("service",)
+    show_full_result_count = False
     readonly_fields = ("created_at",)
     inlines = [ServiceTypePhotoInline]
     autocomplete_fields = ("service",)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related("service").prefetch_related("photos")
+        return (
+            qs.select_related("service")
+            .annotate(
+                _photos_count=Count("photos"),
+                _desc_preview=Substr("description", 1, PREVIEW_LENGTH + 1),
+            )
+            .defer("description")
+        )
 
     def description_preview(self, obj):
-        if obj.description:
-            return (obj.description[:50] + "…") if len(obj.description) > 50 else obj.description
-        return "-"
+        return _preview(obj._desc_preview)
     description_preview.short_description = "Description"
 
     def photos_count(self, obj):
-        return obj.photos.count()
+        return obj._photos_count
     photos_count.short_description = "Photos"
+    photos_count.admin_order_field = "_photos_count"
 
 
 @admin.register(ServicePhoto)
@@ -185,6 +253,8 @@ class ServicePhotoAdmin(admin.ModelAdmin):
     list_filter = ("service", "uploaded_at")
     search_fields = ("service__title", "caption")
     ordering = ("-uploaded_at",)
+    list_select_related = ("service",)
+    show_full_result_count = False
     readonly_fields = ("uploaded_at", "photo_preview")
     autocomplete_fields = ("service",)
     fieldsets = (
@@ -199,7 +269,7 @@ class ServicePhotoAdmin(admin.ModelAdmin):
 
     def photo_preview(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" style="max-width:200px;max-height:200px;border:1px solid #eee;border-radius:6px;padding:4px;" />', obj.photo.url)
+            return format_html('<img src="{}" loading="lazy" decoding="async" style="max-width:200px;max-height:200px;border:1px solid #eee;border-radius:6px;padding:4px;" />', obj.photo.url)
         return "No photo"
     photo_preview.short_description = "Preview"
 
@@ -210,6 +280,8 @@ class ServiceTypePhotoAdmin(admin.ModelAdmin):
     list_filter = ("service_type__service", "uploaded_at")
     search_fields = ("service_type__title", "service_type__service__title", "caption")
     ordering = ("-uploaded_at",)
+    list_select_related = ("service_type", "service_type__service")
+    show_full_result_count = False
     readonly_fields = ("uploaded_at", "photo_preview")
     autocomplete_fields = ("service_type",)
     fieldsets = (
@@ -224,7 +296,7 @@ class ServiceTypePhotoAdmin(admin.ModelAdmin):
 
     def photo_preview(self, obj):
         if obj.photo:
-            return format_html('<img src="{}" style="max-width:200px;max-height:200px;border:1px solid #eee;border-radius:6px;padding:4px;" />', obj.photo.url)
+            return format_html('<img src="{}" loading="lazy" decoding="async" style="max-width:200px;max-height:200px;border:1px solid #eee;border-radius:6px;padding:4px;" />', obj.photo.url)
         return "No photo"
     photo_preview.short_description = "Preview"
 
@@ -235,6 +307,8 @@ class RatingAdmin(admin.ModelAdmin):
     list_filter = ("rating", "service", "created_at")
     search_fields = ("service__title", "user__email", "review")
     ordering = ("-created_at",)
+    list_select_related = ("service", "user")
+    show_full_result_count = False
     readonly_fields = ("created_at",)
     autocomplete_fields = ("service", "user")
     fieldsets = (
@@ -245,14 +319,16 @@ class RatingAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related("service", "user")
+        return (
+            qs.select_related("service", "user")
+            .annotate(_review_preview=Substr("review", 1, PREVIEW_LENGTH + 1))
+            .defer("review")
+        )
 
     def rating_display(self, obj):
-        return format_html("{} {}", obj.rating, "⭐" * int(obj.rating))
+        return format_html("{} {}", obj.rating, _STARS[obj.rating])
     rating_display.short_description = "Rating"
 
     def review_preview(self, obj):
-        if obj.review:
-            return (obj.review[:50] + "…") if len(obj.review) > 50 else obj.review
-        return "No review"
+        return _preview(obj._review_preview, empty="No review")
     review_preview.short_description = "Review"
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from service.models import Service
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalised columns on every Service (run once after deploying them)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        ids = list(Service.objects.order_by("pk").values_list("pk", flat=True))
+        size = opts["batch_size"]
+        for start in range(0, len(ids), size):
+            batch = ids[start:start + size]
+            Service.refresh_category_cache(*batch)
+            Service.update_rating_cache(*batch)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {len(ids)} services."))
@@ -1,11 +1,24 @@
 import os
+import time
 from decimal import Decimal
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django.db.models import Q, Avg
-from django.db.models.functions import Lower
+from django.db.models import Q, Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Lower
+
+from core.storage import delete_files_on_commit
+
+RATING_CACHE_TIMEOUT = 60 * 60
+CATEGORY_LIST_VERSION_KEY = "svc_categories:version"
+UNIT_LIST_CACHE_KEY = "units:all:v1"
+PRICE_ZERO = Decimal("0.00")
+PRICE_MAX = Decimal("10000.00")
+
+
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff")
 
 
 def validate_image_size(image):
@@ -16,12 +29,22 @@ def validate_image_size(image):
 
 
 def validate_image_format(image):
-    valid_formats = {"image/png", "image/jpeg"}
-    ctype = getattr(image, "content_type", None)
-    if ctype and ctype not in valid_formats:
+    f = getattr(image, "file", image)
+    pos = f.tell()
+    f.seek(0)
+    head = f.read(8)
+    f.seek(pos)
+    if not head.startswith(IMAGE_SIGNATURES):
         raise ValidationError("Image must be a PNG or JPEG file.")
 
 
+def validate_image(image):
+    if getattr(image, "_committed", True):
+        return
+    validate_image_size(image)
+    validate_image_format(image)
+
+
 def service_category_upload_to(instance, filename):
     category_name = (instance.title or "category").lower().replace(" ", "_")
     ext = (filename.rsplit(".", 1)[-1] if "." in filename else "png").lower()
@@ -42,13 +65,37 @@ def service_type_image_upload_to(instance, filename):
     return f"service_type/{st_name}.{ext}"
 
 
+def cache_version(key):
+    return cache.get_or_set(key, time.time_ns, timeout=None)
+
+
+def bump_cache_version(key):
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def my_ratings_version_key(user_id):
+    return f"my_ratings:{user_id}:version"
+
+
+class PhotoQuerySet(models.QuerySet):
+    def delete(self):
+        names = list(self.exclude(photo="").values_list("photo", flat=True))
+        result = super().delete()
+        delete_files_on_commit(self.model._meta.get_field("photo").storage, names)
+        return result
+
+    # Mirror QuerySet.delete so as_manager() does not expose Manager.delete().
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class ServiceCategory(models.Model):
     title = models.CharField(max_length=50)
     photo = models.ImageField(
         upload_to=service_category_upload_to,
         blank=True,
         null=True,
-        validators=[validate_image_size, validate_image_format],
+        validators=[validate_image],
     )
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -66,23 +113,31 @@ class ServiceCategory(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "photo" in field_names:
+            instance._loaded_photo_name = instance.photo.name or None
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or "photo" in fields:
+            self._loaded_photo_name = self.photo.name or None
+
     def save(self, *args, **kwargs):
-        old_photo = None
-        if self.pk:
-            try:
-                old = ServiceCategory.objects.get(pk=self.pk)
-                if old.photo and old.photo != self.photo:
-                    old_photo = (old.photo.storage, old.photo.name)
-            except ServiceCategory.DoesNotExist:
-                pass
+        update_fields = kwargs.get("update_fields")
+        old_name = None
+        if self.pk and (update_fields is None or "photo" in update_fields):
+            if hasattr(self, "_loaded_photo_name"):
+                old_name = self._loaded_photo_name
+            else:
+                old_name = ServiceCategory.objects.filter(pk=self.pk).values_list("photo", flat=True).first()
         res = super().save(*args, **kwargs)
-        if old_photo:
-            storage, name = old_photo
-            try:
-                if storage and name:
-                    storage.delete(name)
-            except Exception:
-                pass
+        new_name = self.photo.name or None
+        if old_name and old_name != new_name:
+            delete_files_on_commit(self.photo.storage, [old_name])
+        self._loaded_photo_name = new_name
         return res
 
 
@@ -107,7 +162,7 @@ class Unit(models.Model):
         ]
 
     def save(self, *args, **kwargs):
-        if self.code:
+        if self.code and not self.code.isupper():
             self.code = self.code.upper()
         super().save(*args, **kwargs)
 
@@ -121,14 +176,18 @@ class Service(models.Model):
     price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
-        default=Decimal("0.00"),
-        validators=[MinValueValidator(Decimal("0.00")), MaxValueValidator(Decimal("10000.00"))],
+        default=PRICE_ZERO,
+        validators=[MinValueValidator(PRICE_ZERO), MaxValueValidator(PRICE_MAX)],
     )
     is_trade_required = models.BooleanField(default=False)
     categories = models.ManyToManyField(ServiceCategory, related_name="services", blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     unit = models.ForeignKey(Unit, on_delete=models.SET_NULL, blank=True, null=True, related_name="services")
 
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    category_cache = models.JSONField(null=True, blank=True, editable=False)
+
     class Meta:
         ordering = ["title"]
         constraints = [
@@ -142,10 +201,53 @@ class Service(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.category_cache is None:
+            self.category_cache = []
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def refresh_category_cache(cls, *service_ids):
+        grouped = {service_id: [] for service_id in service_ids}
+        rows = (
+            cls.categories.through.objects.filter(service_id__in=service_ids)
+            .order_by("servicecategory__title")
+            .values_list("service_id", "servicecategory_id", "servicecategory__title")
+        )
+        for service_id, category_id, title in rows:
+            grouped[service_id].append({"id": category_id, "title": title})
+        cls.objects.bulk_update(
+            [cls(pk=service_id, category_cache=categories) for service_id, categories in grouped.items()],
+            ["category_cache"],
+        )
+
     @property
     def average_rating(self):
+        if self.rating_count == 0:
+            return None
+        if self.rating_avg is not None:
+            return self.rating_avg
+        key = self.rating_cache_key(self.pk)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached or None
         result = self.ratings.aggregate(avg_rating=Avg("rating"))
-        return round(result["avg_rating"], 2) if result["avg_rating"] is not None else None
+        avg = round(result["avg_rating"], 2) if result["avg_rating"] is not None else None
+        cache.set(key, avg or 0, timeout=RATING_CACHE_TIMEOUT)
+        return avg
+
+    @staticmethod
+    def rating_cache_key(service_id):
+        return f"svc_avg:{service_id}"
+
+    @classmethod
+    def update_rating_cache(cls, *service_ids):
+        ratings = Rating.objects.filter(service=OuterRef("pk")).order_by().values("service")
+        cls.objects.filter(pk__in=service_ids).update(
+            rating_avg=Subquery(ratings.annotate(avg=Avg("rating")).values("avg")),
+            rating_count=Coalesce(Subquery(ratings.annotate(cnt=Count("id")).values("cnt")), 0),
+        )
+        cache.delete_many([cls.rating_cache_key(service_id) for service_id in service_ids])
 
 
 class ServiceType(models.Model):
@@ -157,7 +259,7 @@ class ServiceType(models.Model):
         decimal_places=2,
         blank=True,
         null=True,
-        validators=[MinValueValidator(Decimal("0.00"))],
+        validators=[MinValueValidator(PRICE_ZERO)],
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -180,11 +282,13 @@ class ServicePhoto(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="photos")
     photo = models.ImageField(
         upload_to=service_image_upload_to,
-        validators=[validate_image_size, validate_image_format],
+        validators=[validate_image],
     )
     caption = models.CharField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PhotoQuerySet.as_manager()
+
     class Meta:
         ordering = ["-uploaded_at"]
 
@@ -192,25 +296,23 @@ class ServicePhoto(models.Model):
         return f"Photo for {self.service.title}"
 
     def delete(self, *args, **kwargs):
-        storage = self.photo.storage if self.photo else None
-        name = self.photo.name if self.photo else None
-        super().delete(*args, **kwargs)
-        if storage and name:
-            try:
-                storage.delete(name)
-            except Exception:
-                pass
+        name = self.photo.name
+        res = super().delete(*args, **kwargs)
+        delete_files_on_commit(self.photo.storage, [name])
+        return res
 
 
 class ServiceTypePhoto(models.Model):
     service_type = models.ForeignKey(ServiceType, on_delete=models.CASCADE, related_name="photos")
     photo = models.ImageField(
         upload_to=service_type_image_upload_to,
-        validators=[validate_image_size, validate_image_format],
+        validators=[validate_image],
     )
     caption = models.CharField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PhotoQuerySet.as_manager()
+
     class Meta:
         ordering = ["-uploaded_at"]
 
@@ -218,14 +320,27 @@ class ServiceTypePhoto(models.Model):
         return f"Photo for {self.service_type.title}"
 
     def delete(self, *args, **kwargs):
-        storage = self.photo.storage if self.photo else None
-        name = self.photo.name if self.photo else None
-        super().delete(*args, **kwargs)
-        if storage and name:
-            try:
-                storage.delete(name)
-            except Exception:
-                pass
+        name = self.photo.name
+        res = super().delete(*args, **kwargs)
+        delete_files_on_commit(self.photo.storage, [name])
+        return res
+
+
+class RatingQuerySet(models.QuerySet):
+    def bulk_upsert(self, objs, batch_size=None):
+        objs = self.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["service", "user"],
+            update_fields=["rating", "review"],
+        )
+        service_ids = {obj.service_id for obj in objs}
+        if service_ids:
+            Service.update_rating_cache(*service_ids)
+        for user_id in {obj.user_id for obj in objs}:
+            bump_cache_version(my_ratings_version_key(user_id))
+        return objs
 
 
 class Rating(models.Model):
@@ -235,6 +350,8 @@ class Rating(models.Model):
     review = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RatingQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         constraints = [
@@ -242,9 +359,9 @@ class Rating(models.Model):
             models.CheckConstraint(check=Q(rating__gte=1) & Q(rating__lte=5), name="chk_rating_between_1_5"),
         ]
         indexes = [
-            models.Index(fields=["service"]),
-            models.Index(fields=["user"]),
-            models.Index(fields=["rating"]),
+            models.Index(fields=["service", "rating"], name="idx_rating_service_rating"),
+            models.Index(fields=["service", "-created_at"], name="idx_rating_svc_created"),
+            models.Index(fields=["user", "-created_at"], name="idx_rating_user_created"),
         ]
 
     def __str__(self):
@@ -1,4 +1,4 @@
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 
 from rest_framework import serializers
 
@@ -8,7 +8,17 @@ from .models import (
 )
 
 def abs_url(request, field):
-    return request.build_absolute_uri(field.url) if request and getattr(field, "url", None) else None
+    if not field:
+        return None
+    url = field.url
+    if not request:
+        return url
+    if not url.startswith("/") or url.startswith("//"):
+        return request.build_absolute_uri(url)
+    base = getattr(request, "_absolute_base", None)
+    if base is None:
+        base = request._absolute_base = f"{request.scheme}://{request.get_host()}"
+    return base + url
 
 class ServiceCategorySerializer(serializers.ModelSerializer):
     photo_url = serializers.SerializerMethodField()
@@ -20,10 +30,7 @@ class ServiceCategorySerializer(serializers.ModelSerializer):
 
     def get_photo_url(self, obj):
         try:
-            request = self.context.get("request")
-            if obj.photo and hasattr(obj.photo, "url"):
-                return request.build_absolute_uri(obj.photo.url) if request else obj.photo.url
-            return None
+            return abs_url(self.context.get("request"), obj.photo)
         except Exception:
             return None
 
@@ -39,30 +46,32 @@ class UnitMiniSerializer(serializers.ModelSerializer):
         model = Unit
         fields = ["id", "name", "code"]
 
-class ServicePhotoSerializer(serializers.ModelSerializer):
-    photo_url = serializers.SerializerMethodField()
-
-    class Meta:
-        model = ServicePhoto
-        fields = ["id", "caption", "uploaded_at", "photo", "photo_url"]
+class PhotoURLSerializer(serializers.ModelSerializer):
+    photo = serializers.SerializerMethodField()
 
-    def get_photo_url(self, obj):
+    def get_photo(self, obj):
         return abs_url(self.context.get("request"), obj.photo)
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["photo_url"] = data["photo"]
+        return data
 
-class ServiceTypePhotoSerializer(serializers.ModelSerializer):
-    photo_url = serializers.SerializerMethodField()
 
+class ServicePhotoSerializer(PhotoURLSerializer):
     class Meta:
-        model = ServiceTypePhoto
-        fields = ["id", "caption", "uploaded_at", "photo", "photo_url"]
+        model = ServicePhoto
+        fields = ["id", "caption", "uploaded_at", "photo"]
 
-    def get_photo_url(self, obj):
-        return abs_url(self.context.get("request"), obj.photo)
+
+class ServiceTypePhotoSerializer(PhotoURLSerializer):
+    class Meta:
+        model = ServiceTypePhoto
+        fields = ["id", "caption", "uploaded_at", "photo"]
 
 
 class ServiceTypeSerializer(serializers.ModelSerializer):
-    photos = ServiceTypePhotoSerializer(many=True, read_only=True)
+    photos = ServiceTypePhotoSerializer(source="recent_photos", many=True, read_only=True)
 
     class Meta:
         model = ServiceType
@@ -92,17 +101,18 @@ class CategoryMiniSerializer(serializers.ModelSerializer):
 
 class ServiceSerializer(serializers.ModelSerializer):
     unit = UnitSerializer(read_only=True)
-    photos = ServicePhotoSerializer(many=True, read_only=True)
+    photos = ServicePhotoSerializer(source="recent_photos", many=True, read_only=True)
     types = ServiceTypeSerializer(many=True, read_only=True)
-    categories = CategoryMiniSerializer(many=True, read_only=True)
+    categories = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    user_has_rated = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Service
         fields = [
             "id", "title", "description", "is_trade_required",
             "price", "unit", "categories", "photos", "types",
-            "average_rating", "created_at"
+            "average_rating", "user_has_rated", "created_at"
         ]
 
     def __init__(self, *args, **kwargs):
@@ -123,17 +133,21 @@ class ServiceSerializer(serializers.ModelSerializer):
         except Exception:
             pass
 
+    def get_categories(self, obj):
+        if obj.category_cache is not None:
+            return obj.category_cache
+        return CategoryMiniSerializer(obj.categories.all(), many=True).data
+
     def get_average_rating(self, obj):
         try:
-            avg = getattr(obj, "avg_rating", None)
-            if avg is None:
-                avg = obj.average_rating
+            avg = obj.average_rating
             return round(float(avg), 2) if avg is not None else None
         except Exception:
             return None
 
 
 class RatingSerializer(serializers.ModelSerializer):
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.only("id", "title"))
     user_email = serializers.EmailField(source="user.email", read_only=True)
     service_title = serializers.CharField(source="service.title", read_only=True)
 
@@ -152,7 +166,6 @@ class RatingSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
         try:
-            user = self.context["request"].user
             if self.instance:
                 if "service" in attrs and attrs["service"].pk != self.instance.service_id:
                     raise serializers.ValidationError({"service": "You cannot change the service of an existing rating."})
@@ -161,8 +174,6 @@ class RatingSerializer(serializers.ModelSerializer):
             service = attrs.get("service")
             if not service:
                 raise serializers.ValidationError({"service": "This field is required."})
-            if Rating.objects.filter(service=service, user=user).exists():
-                raise serializers.ValidationError("You have already rated this service.")
             return attrs
         except Exception as e:
             raise serializers.ValidationError(str(e))
@@ -170,7 +181,8 @@ class RatingSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         try:
             user = self.context["request"].user
-            return Rating.objects.create(user=user, **validated_data)
+            with transaction.atomic():
+                return Rating.objects.create(user=user, **validated_data)
         except IntegrityError:
             raise serializers.ValidationError("You have already rated this service.")
         except Exception as e:
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import (
+    CATEGORY_LIST_VERSION_KEY,
+    UNIT_LIST_CACHE_KEY,
+    Rating,
+    Service,
+    ServiceCategory,
+    Unit,
+    bump_cache_version,
+    my_ratings_version_key,
+)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def refresh_service_rating_cache(sender, instance, **kwargs):
+    Service.update_rating_cache(instance.service_id)
+    bump_cache_version(my_ratings_version_key(instance.user_id))
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_delete, sender=ServiceCategory)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(m2m_changed, sender=Service.categories.through)
+def invalidate_category_list(sender, **kwargs):
+    bump_cache_version(CATEGORY_LIST_VERSION_KEY)
+
+
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+def invalidate_unit_list(sender, **kwargs):
+    cache.delete(UNIT_LIST_CACHE_KEY)
+
+
+@receiver(m2m_changed, sender=Service.categories.through)
+def refresh_service_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        instance._cleared_service_ids = list(instance.services.values_list("pk", flat=True))
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    if not reverse:
+        Service.refresh_category_cache(instance.pk)
+        return
+    service_ids = pk_set if action != "post_clear" else instance.__dict__.pop("_cleared_service_ids", [])
+    if service_ids:
+        Service.refresh_category_cache(*service_ids)
+
+
+@receiver(pre_delete, sender=ServiceCategory)
+def remember_category_services(sender, instance, **kwargs):
+    instance._cached_service_ids = list(instance.services.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=ServiceCategory)
+@receiver(post_delete, sender=ServiceCategory)
+def refresh_category_services(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    service_ids = getattr(instance, "_cached_service_ids", None)
+    if service_ids is None:
+        service_ids = list(instance.services.values_list("pk", flat=True))
+    if service_ids:
+        Service.refresh_category_cache(*service_ids)
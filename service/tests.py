@@ -1,3 +1,144 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .models import Rating, Service, ServiceCategory, ServicePhoto, ServiceTypePhoto
+
+User = get_user_model()
+
+
+class ServiceCategoryCacheTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(title="Painting")
+        self.walls = ServiceCategory.objects.create(title="Walls")
+        self.doors = ServiceCategory.objects.create(title="Doors")
+
+    def _cache(self):
+        self.service.refresh_from_db(fields=["category_cache"])
+        return self.service.category_cache
+
+    def test_cache_follows_membership_and_titles(self):
+        self.assertEqual(self._cache(), [])
+
+        self.service.categories.add(self.walls, self.doors)
+        self.assertEqual(self._cache(), [
+            {"id": self.doors.pk, "title": "Doors"},
+            {"id": self.walls.pk, "title": "Walls"},
+        ])
+
+        self.walls.title = "Interior walls"
+        self.walls.save()
+        self.assertIn({"id": self.walls.pk, "title": "Interior walls"}, self._cache())
+
+        self.doors.services.clear()
+        self.assertEqual(self._cache(), [{"id": self.walls.pk, "title": "Interior walls"}])
+
+        self.walls.delete()
+        self.assertEqual(self._cache(), [])
+
+    def test_backfill_fills_missing_cache(self):
+        self.service.categories.add(self.walls)
+        Service.objects.update(category_cache=None)
+
+        call_command("backfill_service_fields", stdout=StringIO())
+
+        self.assertEqual(self._cache(), [{"id": self.walls.pk, "title": "Walls"}])
+
+
+class ServiceAverageRatingTests(TestCase):
+    def test_unrated_service_needs_no_query(self):
+        service = Service.objects.create(title="Tiling")
+        with self.assertNumQueries(0):
+            self.assertIsNone(service.average_rating)
+
+    def test_backfill_fills_rating_columns(self):
+        service = Service.objects.create(title="Fencing")
+        user = User.objects.create_user(email="rater@example.com", password="pw-12345678")
+        Rating.objects.create(service=service, user=user, rating=4)
+        Service.objects.update(rating_avg=None, rating_count=0)
+
+        call_command("backfill_service_fields", stdout=StringIO())
+
+        service.refresh_from_db()
+        self.assertEqual(service.rating_count, 1)
+        self.assertEqual(service.average_rating, 4)
+
+
+class ServiceRatingColumnsTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(title="Decking")
+        self.alice = User.objects.create_user(email="alice@example.com", password="pw-12345678")
+        self.bob = User.objects.create_user(email="bob@example.com", password="pw-12345678")
+
+    def _columns(self):
+        self.service.refresh_from_db(fields=["rating_avg", "rating_count"])
+        return self.service.rating_avg, self.service.rating_count
+
+    def test_columns_follow_rating_writes(self):
+        first = Rating.objects.create(service=self.service, user=self.alice, rating=5)
+        Rating.objects.create(service=self.service, user=self.bob, rating=2)
+        self.assertEqual(self._columns(), (Decimal("3.50"), 2))
+
+        first.rating = 3
+        first.save()
+        self.assertEqual(self._columns(), (Decimal("2.50"), 2))
+
+        first.delete()
+        self.assertEqual(self._columns(), (Decimal("2.00"), 1))
+
+
+class RatingBulkUpsertTests(TestCase):
+    def test_upsert_inserts_updates_and_refreshes_columns(self):
+        service = Service.objects.create(title="Landscaping")
+        alice = User.objects.create_user(email="alice@example.com", password="pw-12345678")
+        bob = User.objects.create_user(email="bob@example.com", password="pw-12345678")
+        Rating.objects.create(service=service, user=alice, rating=1)
+
+        Rating.objects.bulk_upsert([
+            Rating(service=service, user=alice, rating=5, review="Much better"),
+            Rating(service=service, user=bob, rating=3),
+        ])
+
+        self.assertEqual(Rating.objects.filter(service=service).count(), 2)
+        self.assertEqual(Rating.objects.get(service=service, user=alice).review, "Much better")
+        service.refresh_from_db()
+        self.assertEqual((service.rating_avg, service.rating_count), (Decimal("4.00"), 2))
+
+
+class ConditionalListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_category_list_revalidates_until_a_category_changes(self):
+        ServiceCategory.objects.create(title="Outdoor")
+        first = self.client.get("/service/categories/")
+        etag = first["ETag"]
+        self.assertEqual(self.client.get("/service/categories/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        ServiceCategory.objects.create(title="Indoor")
+        response = self.client.get("/service/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_my_ratings_list_revalidates_after_rating(self):
+        user = User.objects.create_user(email="me@example.com", password="pw-12345678")
+        client = APIClient()
+        client.force_authenticate(user)
+        etag = client.get("/service/ratings/mine/")["ETag"]
+        self.assertEqual(client.get("/service/ratings/mine/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Rating.objects.create(service=Service.objects.create(title="Masonry"), user=user, rating=4)
+        response = client.get("/service/ratings/mine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
 
-# Create your tests here.
+class PhotoManagerTests(TestCase):
+    def test_manager_does_not_expose_delete(self):
+        self.assertFalse(hasattr(ServicePhoto.objects, "delete"))
+        self.assertFalse(hasattr(ServiceTypePhoto.objects, "delete"))
@@ -1,11 +1,29 @@
-from django.db.models import Count, Prefetch, Avg
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import BooleanField, Count, Exists, F, OuterRef, Prefetch, Value
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 
 from rest_framework import generics, permissions, filters, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
 
-from .models import ServiceCategory, Service, ServiceType, ServicePhoto, Rating, Unit
+from .models import (
+    ServiceCategory,
+    Service,
+    ServiceType,
+    ServicePhoto,
+    ServiceTypePhoto,
+    Rating,
+    Unit,
+    CATEGORY_LIST_VERSION_KEY,
+    UNIT_LIST_CACHE_KEY,
+    cache_version,
+    my_ratings_version_key,
+)
 from .serializers import (
     ServiceCategorySerializer,
     ServiceSerializer,
@@ -16,6 +34,43 @@ from .serializers import (
 
 from .permissions import IsOwnerOrReadOnly
 
+PHOTOS_PER_ITEM = 10
+CATEGORY_LIST_CACHE_TIMEOUT = 60 * 5
+MY_RATINGS_CACHE_TIMEOUT = 60 * 5
+UNIT_LIST_CACHE_TIMEOUT = 60 * 60
+
+_RATING_FIELDS = (
+    "id", "rating", "review", "created_at",
+    "service_id", "user_id", "service__title", "user__email",
+)
+
+
+def _ratings():
+    return Rating.objects.select_related("service", "user").only(*_RATING_FIELDS)
+
+
+def _cached_list(request, prefix, version, render, timeout):
+    etag = quote_etag(str(version))
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    key = f"{prefix}:{version}:{url}"
+    data = cache.get(key)
+    if data is None:
+        data = render().data
+        cache.set(key, data, timeout=timeout)
+
+    response = Response(data)
+    response["ETag"] = etag
+    return response
+
+
+class BoundedPageNumberPagination(PageNumberPagination):
+    page_size_query_param = "page_size"
+    max_page_size = 50
+
 class ServiceCategoryListView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = ServiceCategorySerializer
@@ -34,9 +89,20 @@ class ServiceCategoryListView(generics.ListAPIView):
         except Exception:
             return ServiceCategory.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        render = super().list
+        return _cached_list(
+            request,
+            "svc_categories",
+            cache_version(CATEGORY_LIST_VERSION_KEY),
+            lambda: render(request, *args, **kwargs),
+            CATEGORY_LIST_CACHE_TIMEOUT,
+        )
+
 class ServiceListView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = ServiceSerializer
+    pagination_class = BoundedPageNumberPagination
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["title", "description", "types__title"]
     ordering_fields = ["price", "created_at", "avg_rating"]
@@ -52,26 +118,50 @@ class ServiceListView(generics.ListAPIView):
                 Service.objects
                 .select_related("unit")
                 .prefetch_related(
-                    "categories",
-                    Prefetch("photos", queryset=ServicePhoto.objects.order_by("-uploaded_at")),
+                    Prefetch(
+                        "photos",
+                        queryset=ServicePhoto.objects.order_by("-uploaded_at")[:PHOTOS_PER_ITEM],
+                        to_attr="recent_photos",
+                    ),
                 )
-                .annotate(avg_rating=Avg("ratings__rating"))
+                .alias(avg_rating=F("rating_avg"))
             )
 
             if self._include_types():
                 qs = qs.prefetch_related(
-                    Prefetch("types", queryset=ServiceType.objects.prefetch_related("photos").order_by("title"))
+                    Prefetch(
+                        "types",
+                        queryset=ServiceType.objects.prefetch_related(
+                            Prefetch(
+                                "photos",
+                                queryset=ServiceTypePhoto.objects.order_by("-uploaded_at")[:PHOTOS_PER_ITEM],
+                                to_attr="recent_photos",
+                            )
+                        ).order_by("title"),
+                    )
                 )
 
+            user = self.request.user
+            if user.is_authenticated:
+                qs = qs.annotate(
+                    user_has_rated=Exists(Rating.objects.filter(service=OuterRef("pk"), user_id=user.id))
+                )
+            else:
+                qs = qs.annotate(user_has_rated=Value(False, output_field=BooleanField()))
+
             category_id = self.request.query_params.get("category")
             if category_id:
-                qs = qs.filter(categories__id=category_id)
+                qs = qs.filter(
+                    pk__in=Service.categories.through.objects
+                    .filter(servicecategory_id=category_id)
+                    .values("service_id")
+                )
 
             unit_id = self.request.query_params.get("unit")
             if unit_id:
                 qs = qs.filter(unit_id=unit_id)
 
-            return qs.distinct()
+            return qs
         except Exception:
             return Service.objects.none()
 
@@ -108,8 +198,9 @@ class ServiceTypeDetailView(generics.RetrieveAPIView):
 
 
 class RatingListCreateView(generics.ListCreateAPIView):
-    queryset = Rating.objects.select_related("service", "user").order_by("-created_at")
+    queryset = _ratings().order_by("-created_at")
     serializer_class = RatingSerializer
+    pagination_class = BoundedPageNumberPagination
     permission_classes = [permissions.AllowAny]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["review", "service__title", "user__email"]
@@ -123,7 +214,7 @@ class RatingListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         try:
-            return Rating.objects.select_related("service", "user").order_by("-created_at")
+            return _ratings().order_by("-created_at")
         except Exception:
             return Rating.objects.none()
 
@@ -135,7 +226,7 @@ class RatingListCreateView(generics.ListCreateAPIView):
             return {}
 
 class RatingDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Rating.objects.select_related("service", "user")
+    queryset = _ratings()
     serializer_class = RatingSerializer
     permission_classes = [IsOwnerOrReadOnly]
 
@@ -151,10 +242,20 @@ class MyRatingListView(generics.ListAPIView):
 
     def get_queryset(self):
         try:
-            return Rating.objects.select_related("service", "user").filter(user=self.request.user)
+            return _ratings().filter(user=self.request.user)
         except Exception:
             return Rating.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        render = super().list
+        return _cached_list(
+            request,
+            f"my_ratings:{request.user.pk}",
+            cache_version(my_ratings_version_key(request.user.pk)),
+            lambda: render(request, *args, **kwargs),
+            MY_RATINGS_CACHE_TIMEOUT,
+        )
+
 class ServiceRatingListView(generics.ListAPIView):
     serializer_class = RatingSerializer
     permission_classes = [permissions.AllowAny]
@@ -166,15 +267,18 @@ class ServiceRatingListView(generics.ListAPIView):
     def get_queryset(self):
         try:
             service_id = self.kwargs["service_id"]
-            return Rating.objects.select_related("service", "user").filter(service_id=service_id)
+            return _ratings().filter(service_id=service_id)
         except Exception:
             return Rating.objects.none()
 
 class UnitListView(APIView):
     def get(self, request):
-        units = Unit.objects.all()
-        serializer = UnitSerializer(units, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = cache.get_or_set(
+            UNIT_LIST_CACHE_KEY,
+            lambda: UnitSerializer(Unit.objects.all(), many=True).data,
+            timeout=UNIT_LIST_CACHE_TIMEOUT,
+        )
+        return Response(data, status=status.HTTP_200_OK)
     
 class UnitDetailView(APIView):
     def get(self, request, pk):
@@ -1,8 +1,14 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.db.models.functions import Substr
+from django.utils.safestring import mark_safe
 
 from .models import SubscriptionPlan, UserSubscription
 
+PREVIEW_LENGTH = 80
+_BADGE_TMPL = '<span style="padding:2px 8px;border-radius:12px;color:white;background:{};">{}</span>'
+_ACTIVE_BADGE = mark_safe(_BADGE_TMPL.format("#16a34a", "Active"))
+_INACTIVE_BADGE = mark_safe(_BADGE_TMPL.format("#ef4444", "Inactive"))
+
 
 @admin.register(SubscriptionPlan)
 class SubscriptionPlanAdmin(admin.ModelAdmin):
@@ -11,12 +17,19 @@ class SubscriptionPlanAdmin(admin.ModelAdmin):
     search_fields = ("name",)
     ordering = ("price",)
 
+    def get_queryset(self, request):
+        return (
+            super().get_queryset(request)
+            .annotate(_desc_preview=Substr("description", 1, PREVIEW_LENGTH + 1))
+            .defer("description")
+        )
+
     @admin.display(description="Description")
     def short_description(self, obj):
-        if not obj.description:
+        text = obj._desc_preview
+        if not text:
             return "-"
-        text = str(obj.description)
-        return (text[:80] + "…") if len(text) > 80 else text
+        return (text[:PREVIEW_LENGTH] + "…") if len(text) > PREVIEW_LENGTH else text
 
 
 @admin.register(UserSubscription)
@@ -46,13 +59,7 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
 
     @admin.display(description="Active")
     def active_badge(self, obj):
-        color = "#16a34a" if obj.active else "#ef4444"
-        label = "Active" if obj.active else "Inactive"
-        return format_html(
-            '<span style="padding:2px 8px;border-radius:12px;color:white;background:{};">{}</span>',
-            color,
-            label,
-        )
+        return _ACTIVE_BADGE if obj.active else _INACTIVE_BADGE
 
     @admin.display(description="Stripe Subscription ID")
     def masked_stripe_subscription_id(self, obj):
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.core.management.base import BaseCommand
+
+from subscription.models import UserSubscription
+from subscription.views import _sync_subscription
+
+
+def _fetch(sub):
+    try:
+        return sub, stripe.Subscription.retrieve(sub.stripe_subscription_id), None
+    except stripe.error.StripeError as e:
+        return sub, None, e
+
+
+class Command(BaseCommand):
+    help = "Re-sync local subscriptions with their current state in Stripe."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+
+    def handle(self, *args, **opts):
+        subs = list(
+            UserSubscription.objects.exclude(stripe_subscription_id__isnull=True)
+            .exclude(stripe_subscription_id="")
+        )
+        synced = failed = 0
+        with ThreadPoolExecutor(max_workers=opts["workers"]) as pool:
+            for sub, remote, error in pool.map(_fetch, subs):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f"{sub.stripe_subscription_id}: {error}")
+                    continue
+                _sync_subscription(sub, remote)
+                synced += 1
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} subscriptions, {failed} failed."))
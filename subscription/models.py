@@ -12,9 +12,6 @@ class SubscriptionPlan(models.Model):
 
     class Meta:
         ordering = ['price']
-        indexes = [
-            models.Index(fields=['stripe_plan_id']),
-        ]
 
     def __str__(self):
         return f"{self.name} (${self.price})"
@@ -37,6 +34,7 @@ class UserSubscription(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField(blank=True, null=True)
     trial_end = models.DateTimeField(blank=True, null=True)
+    checkout_key = models.CharField(max_length=100, blank=True, null=True)
 
     class Meta:
         indexes = [
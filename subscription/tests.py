@@ -1,3 +1,122 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import SubscriptionPlan, UserSubscription
+
+User = get_user_model()
+
+
+def _event(event_type, sub_id, customer, price_id, sub_status="active"):
+    now = int(timezone.now().timestamp())
+    return {
+        "type": event_type,
+        "data": {
+            "object": {
+                "id": sub_id,
+                "customer": customer,
+                "status": sub_status,
+                "items": {"data": [{"price": {"id": price_id}}]},
+                "current_period_start": now,
+                "current_period_end": now + 30 * 86400,
+                "trial_end": None,
+            }
+        },
+    }
+
+
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.plan = SubscriptionPlan.objects.create(name="Pro", stripe_plan_id="price_pro", price="9.99")
+        self.user = User.objects.create_user(email="pro@example.com", password="pw-12345678", stripe_customer_id="cus_1")
+        self.url = reverse("subscriptions:stripe-webhook")
+
+    def _post(self, event):
+        with mock.patch("subscription.views.stripe.Webhook.construct_event", return_value=event):
+            return self.client.post(self.url, data=b"{}", content_type="application/json")
+
+    def _paid_subscription(self):
+        return UserSubscription.objects.create(
+            user=self.user,
+            plan=self.plan,
+            stripe_subscription_id="sub_paid",
+            active=True,
+            start_date=timezone.now() - timedelta(days=1),
+        )
+
+    def test_known_id_is_synced(self):
+        self._paid_subscription()
+        response = self._post(_event("customer.subscription.updated", "sub_paid", "cus_1", "price_pro", "past_due"))
+        self.assertEqual(response.status_code, 200)
+        sub = UserSubscription.objects.get(user=self.user)
+        self.assertEqual(sub.stripe_subscription_id, "sub_paid")
+        self.assertFalse(sub.active)
+
+    def test_unknown_id_update_does_not_overwrite_current_subscription(self):
+        self._paid_subscription()
+        response = self._post(
+            _event("customer.subscription.updated", "sub_stray", "cus_1", "price_pro", "incomplete_expired")
+        )
+        self.assertEqual(response.status_code, 200)
+        sub = UserSubscription.objects.get(user=self.user)
+        self.assertEqual(sub.stripe_subscription_id, "sub_paid")
+        self.assertTrue(sub.active)
+
+    def test_first_subscription_is_adopted(self):
+        response = self._post(_event("customer.subscription.created", "sub_new", "cus_1", "price_pro"))
+        self.assertEqual(response.status_code, 200)
+        sub = UserSubscription.objects.get(user=self.user)
+        self.assertEqual(sub.stripe_subscription_id, "sub_new")
+        self.assertEqual(sub.plan, self.plan)
+        self.assertTrue(sub.active)
+
+    def test_unknown_customer_is_ignored(self):
+        response = self._post(_event("customer.subscription.created", "sub_new", "cus_other", "price_pro"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UserSubscription.objects.exists())
+
+
+class SubscriptionSheetIdempotencyTests(TestCase):
+    def setUp(self):
+        self.plan = SubscriptionPlan.objects.create(name="Pro", stripe_plan_id="price_pro", price="9.99")
+        self.user = User.objects.create_user(email="pro@example.com", password="pw-12345678", stripe_customer_id="cus_1")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("subscriptions:subscribe")
+
+    def _subscribe(self, sub_id, **headers):
+        created = {"id": sub_id, "latest_invoice": {"payment_intent": {"client_secret": "pi_secret"}}}
+        with mock.patch(
+            "subscription.views._create_ephemeral_key", return_value=("cus_1", mock.Mock(secret="ek_secret"))
+        ), mock.patch("subscription.views.stripe.Subscription.create", return_value=created) as create:
+            response = self.client.post(self.url, {"plan_id": self.plan.id}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return create.call_args.kwargs["idempotency_key"]
+
+    def test_retrying_an_open_checkout_reuses_the_key(self):
+        first = self._subscribe("sub_a")
+        self.assertEqual(self._subscribe("sub_a"), first)
+
+    def test_resubscribing_after_cancel_uses_a_new_key(self):
+        first = self._subscribe("sub_a")
+        with mock.patch("subscription.views.stripe.Subscription.delete"):
+            self.client.post(reverse("subscriptions:cancel-now"))
+        second = self._subscribe("sub_b")
+        self.assertNotEqual(first, second)
+        self.assertEqual(self._subscribe("sub_b"), second)
+
+    def test_client_idempotency_key_is_used(self):
+        key = self._subscribe("sub_a", **{"Idempotency-Key": "attempt-1"})
+        self.assertTrue(key.endswith(":attempt-1"))
 
-# Create your tests here.
+    def test_completed_checkout_clears_the_key(self):
+        self._subscribe("sub_a")
+        event = _event("customer.subscription.updated", "sub_a", "cus_1", "price_pro")
+        with mock.patch("subscription.views.stripe.Webhook.construct_event", return_value=event):
+            self.client.post(reverse("subscriptions:stripe-webhook"), data={}, format="json")
+        self.assertIsNone(UserSubscription.objects.get(user=self.user).checkout_key)
@@ -2,6 +2,7 @@ from django.urls import path
 from .views import (
     SubscriptionSheetView,
     SubscriptionSuccessView,
+    StripeWebhookView,
     ChangePlanView,
     CancelAtPeriodEndView,
     CancelNowView,
@@ -16,6 +17,7 @@ urlpatterns = [
     path("plans/", ListPlansView.as_view(), name="list-plans"),
     path("subscribe/", SubscriptionSheetView.as_view(), name="subscribe"),
     path("subscribe/success/", SubscriptionSuccessView.as_view(), name="subscribe-success"),
+    path("webhook/", StripeWebhookView.as_view(), name="stripe-webhook"),
     path("change-plan/", ChangePlanView.as_view(), name="change-plan"),
     path("cancel/at-period-end/", CancelAtPeriodEndView.as_view(), name="cancel-at-period-end"),
     path("cancel/now/", CancelNowView.as_view(), name="cancel-now"),
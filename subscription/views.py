@@ -1,4 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timezone as dt_timezone
+import logging
+import requests
 import stripe
 
 from django.conf import settings
@@ -6,6 +8,8 @@ from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django.http import JsonResponse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control, cache_page
 
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
@@ -16,22 +20,55 @@ from rest_framework import status
 from .models import SubscriptionPlan, UserSubscription
 from .serializers import SubscriptionPlanSerializer, UserSubscriptionSerializer
 
+logger = logging.getLogger(__name__)
+
 stripe.api_key = settings.STRIPE_SECRET_KEY
+_stripe_session = requests.Session()
+_stripe_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+stripe.default_http_client = stripe.RequestsClient(session=_stripe_session)
+stripe.max_network_retries = 2
 User = get_user_model()
 
 
-def _get_or_create_customer(user: User):
-    if getattr(user, "stripe_customer_id", None):
-        try:
-            stripe.Customer.retrieve(user.stripe_customer_id)
-            return user.stripe_customer_id
-        except stripe.error.InvalidRequestError:
-            pass
+def _get_or_create_customer(user: User, recreate=False):
+    if getattr(user, "stripe_customer_id", None) and not recreate:
+        return user.stripe_customer_id
     customer = stripe.Customer.create(email=user.email or None)
     User.objects.filter(pk=user.pk).update(stripe_customer_id=customer["id"])
+    user.stripe_customer_id = customer["id"]
     return customer["id"]
 
 
+def _create_ephemeral_key(user: User):
+    customer_id = _get_or_create_customer(user)
+    try:
+        key = stripe.EphemeralKey.create(customer=customer_id, stripe_version="2022-11-15")
+    except stripe.error.InvalidRequestError as e:
+        if e.code != "resource_missing":
+            raise
+        customer_id = _get_or_create_customer(user, recreate=True)
+        key = stripe.EphemeralKey.create(customer=customer_id, stripe_version="2022-11-15")
+    return customer_id, key
+
+
+def _stripe_subscription_id(user: User):
+    return (
+        UserSubscription.objects.filter(user=user)
+        .values_list("stripe_subscription_id", flat=True)
+        .first()
+    )
+
+
+def _checkout_attempt(user: User):
+    # The stored key of an open checkout, else the subscription the row last
+    # tracked; both stay fixed until the checkout is completed or cancelled,
+    # so a resubmitted request replays the same Subscription.create.
+    row = UserSubscription.objects.filter(user=user).values("checkout_key", "stripe_subscription_id").first()
+    if row is None:
+        return "new"
+    return row["checkout_key"] or row["stripe_subscription_id"] or "new"
+
+
 class SubscriptionSheetView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -42,38 +79,36 @@ class SubscriptionSheetView(APIView):
 
         plan = get_object_or_404(SubscriptionPlan, id=plan_id)
 
+        attempt = request.headers.get("Idempotency-Key", "")[:64] or _checkout_attempt(request.user)
+
         try:
-            customer_id = _get_or_create_customer(request.user)
-            ephemeral_key = stripe.EphemeralKey.create(
-                customer=customer_id,
-                stripe_version="2022-11-15",
-            )
+            customer_id, ephemeral_key = _create_ephemeral_key(request.user)
             subscription = stripe.Subscription.create(
                 customer=customer_id,
                 items=[{"price": plan.stripe_plan_id}],
                 payment_behavior="default_incomplete",
                 payment_settings={"save_default_payment_method": "on_subscription"},
                 expand=["latest_invoice.payment_intent"],
+                idempotency_key=f"sub-create:{customer_id}:{plan.stripe_plan_id}:{attempt}",
             )
             pi = subscription["latest_invoice"]["payment_intent"]
             client_secret = pi["client_secret"]
 
-            sub_obj, _ = UserSubscription.objects.get_or_create(
-                user=request.user,
-                defaults={
-                    "plan": plan,
-                    "stripe_subscription_id": subscription["id"],
-                    "active": False,
-                    "start_date": timezone.now(),
-                    "end_date": None,
-                    "trial_end": None,
-                },
+            updated = UserSubscription.objects.filter(user=request.user).update(
+                plan=plan,
+                stripe_subscription_id=subscription["id"],
+                active=False,
+                checkout_key=attempt,
             )
-            if sub_obj.plan_id != plan.id or sub_obj.stripe_subscription_id != subscription["id"]:
-                sub_obj.plan = plan
-                sub_obj.stripe_subscription_id = subscription["id"]
-                sub_obj.active = False
-                sub_obj.save(update_fields=["plan", "stripe_subscription_id", "active"])
+            if not updated:
+                UserSubscription.objects.create(
+                    user=request.user,
+                    plan=plan,
+                    stripe_subscription_id=subscription["id"],
+                    active=False,
+                    checkout_key=attempt,
+                    start_date=timezone.now(),
+                )
 
             return Response(
                 {
@@ -97,6 +132,46 @@ class SubscriptionSheetView(APIView):
             return Response({"detail": "Unexpected error.", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _aware(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc) if ts else None
+
+
+def _sync_subscription(sub_obj, subscription):
+    items = subscription.get("items", {}).get("data", [])
+    price_id = items[0]["price"]["id"] if items else None
+    sub_obj.plan = SubscriptionPlan.objects.filter(stripe_plan_id=price_id).first()
+    sub_obj.stripe_subscription_id = subscription["id"]
+    sub_obj.active = subscription["status"] in ("active", "trialing")
+    sub_obj.start_date = _aware(subscription.get("current_period_start")) or timezone.now()
+    sub_obj.end_date = _aware(subscription.get("current_period_end"))
+    sub_obj.trial_end = _aware(subscription.get("trial_end"))
+    if subscription["status"] != "incomplete":
+        sub_obj.checkout_key = None
+    sub_obj.save()
+    return sub_obj
+
+
+def _activation_response(sub_obj, status_str):
+    plan = sub_obj.plan
+    return Response(
+        {
+            "message": "Subscription activated.",
+            "stripe_subscription_id": sub_obj.stripe_subscription_id,
+            "status": status_str,
+            "plan": {
+                "id": plan.id if plan else None,
+                "name": plan.name if plan else None,
+                "price": str(plan.price) if plan else None,
+            },
+            "start_date": sub_obj.start_date.isoformat(),
+            "end_date": sub_obj.end_date.isoformat() if sub_obj.end_date else None,
+            "trial_end": sub_obj.trial_end.isoformat() if sub_obj.trial_end else None,
+            "active": sub_obj.active,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 class SubscriptionSuccessView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -105,6 +180,15 @@ class SubscriptionSuccessView(APIView):
         if not sub_id:
             return Response({"detail": "stripe_subscription_id is required."}, status=status.HTTP_400_BAD_REQUEST)
 
+        local = (
+            UserSubscription.objects.select_related("plan")
+            .filter(user=request.user, stripe_subscription_id=sub_id, active=True)
+            .first()
+        )
+        if local:
+            trialing = local.trial_end is not None and local.trial_end > timezone.now()
+            return _activation_response(local, "trialing" if trialing else "active")
+
         try:
             subscription = stripe.Subscription.retrieve(sub_id, expand=["latest_invoice.payment_intent"])
         except stripe.error.StripeError as e:
@@ -122,41 +206,56 @@ class SubscriptionSuccessView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        items = subscription.get("items", {}).get("data", [])
-        price_id = items[0]["price"]["id"] if items else None
-        plan = SubscriptionPlan.objects.filter(stripe_plan_id=price_id).first()
-
-        sub_obj, _ = UserSubscription.objects.get_or_create(user=request.user)
-        sub_obj.plan = plan
-        sub_obj.stripe_subscription_id = subscription["id"]
-        sub_obj.active = True
-
-        cps = subscription.get("current_period_start")
-        cpe = subscription.get("current_period_end")
-        trl = subscription.get("trial_end")
-
-        sub_obj.start_date = timezone.make_aware(datetime.fromtimestamp(cps)) if cps else timezone.now()
-        sub_obj.end_date = timezone.make_aware(datetime.fromtimestamp(cpe)) if cpe else None
-        sub_obj.trial_end = timezone.make_aware(datetime.fromtimestamp(trl)) if trl else None
-        sub_obj.save()
-
-        return Response(
-            {
-                "message": "Subscription activated.",
-                "stripe_subscription_id": subscription["id"],
-                "status": status_str,
-                "plan": {
-                    "id": plan.id if plan else None,
-                    "name": plan.name if plan else None,
-                    "price": str(plan.price) if plan else None,
-                },
-                "start_date": sub_obj.start_date.isoformat(),
-                "end_date": sub_obj.end_date.isoformat() if sub_obj.end_date else None,
-                "trial_end": sub_obj.trial_end.isoformat() if sub_obj.trial_end else None,
-                "active": sub_obj.active,
-            },
-            status=status.HTTP_200_OK,
-        )
+        sub_obj = UserSubscription.objects.filter(user=request.user).first() or UserSubscription(user=request.user)
+        _sync_subscription(sub_obj, subscription)
+        return _activation_response(sub_obj, status_str)
+
+
+class StripeWebhookView(APIView):
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = []
+
+    def post(self, request):
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.META.get("HTTP_STRIPE_SIGNATURE", ""),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.error.SignatureVerificationError):
+            return Response({"detail": "Invalid webhook payload."}, status=status.HTTP_400_BAD_REQUEST)
+
+        subscription = event["data"]["object"]
+        if event["type"] == "customer.subscription.deleted":
+            UserSubscription.objects.filter(stripe_subscription_id=subscription["id"]).update(
+                active=False, end_date=timezone.now(), checkout_key=None
+            )
+        elif event["type"] in ("customer.subscription.created", "customer.subscription.updated"):
+            sub_obj = UserSubscription.objects.filter(stripe_subscription_id=subscription["id"]).first()
+            if sub_obj is None:
+                sub_obj = self._adopt(event["type"], subscription)
+            if sub_obj is not None:
+                _sync_subscription(sub_obj, subscription)
+            else:
+                logger.info("Ignoring %s for unknown subscription %s", event["type"], subscription["id"])
+        return Response(status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _adopt(event_type, subscription):
+        # An unknown id may only take over the customer's row when Stripe
+        # reports a new subscription or the row is not tracking one yet;
+        # otherwise a stray (e.g. abandoned incomplete) subscription would
+        # overwrite the one the user is paying for.
+        user = User.objects.filter(stripe_customer_id=subscription["customer"]).first()
+        if user is None:
+            return None
+        sub_obj = UserSubscription.objects.filter(user=user).first()
+        if sub_obj is None:
+            return UserSubscription(user=user)
+        if event_type == "customer.subscription.created" or not sub_obj.stripe_subscription_id:
+            return sub_obj
+        return None
 
 
 class ChangePlanView(APIView):
@@ -171,15 +270,21 @@ class ChangePlanView(APIView):
         except SubscriptionPlan.DoesNotExist:
             return Response({"detail": "Invalid subscription plan."}, status=status.HTTP_404_NOT_FOUND)
 
-        us = getattr(request.user, "professional_subscription", None)
-        if not us or not us.stripe_subscription_id:
+        sub_id, current_plan_id = (
+            UserSubscription.objects.filter(user=request.user)
+            .values_list("stripe_subscription_id", "plan_id")
+            .first()
+        ) or (None, None)
+        if not sub_id:
             return Response({"detail": "No active subscription to change."}, status=status.HTTP_400_BAD_REQUEST)
+        if current_plan_id == plan.id:
+            return Response({"message": "Plan unchanged."}, status=status.HTTP_200_OK)
 
         try:
-            sub = stripe.Subscription.retrieve(us.stripe_subscription_id)
+            sub = stripe.Subscription.retrieve(sub_id)
             item_id = sub["items"]["data"][0]["id"]
             stripe.Subscription.modify(
-                us.stripe_subscription_id,
+                sub_id,
                 items=[{"id": item_id, "price": plan.stripe_plan_id}],
                 proration_behavior="create_prorations",
             )
@@ -192,11 +297,11 @@ class CancelAtPeriodEndView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        us = getattr(request.user, "professional_subscription", None)
-        if not us or not us.stripe_subscription_id:
+        sub_id = _stripe_subscription_id(request.user)
+        if not sub_id:
             return Response({"detail": "No active subscription to cancel."}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            stripe.Subscription.modify(us.stripe_subscription_id, cancel_at_period_end=True)
+            stripe.Subscription.modify(sub_id, cancel_at_period_end=True)
             return Response({"message": "Will cancel at period end."}, status=status.HTTP_200_OK)
         except stripe.error.StripeError as e:
             return Response({"detail": "Stripe error.", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -206,12 +311,14 @@ class CancelNowView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        us = getattr(request.user, "professional_subscription", None)
-        if not us or not us.stripe_subscription_id:
+        sub_id = _stripe_subscription_id(request.user)
+        if not sub_id:
             return Response({"detail": "No active subscription to cancel."}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            stripe.Subscription.delete(us.stripe_subscription_id)
-            UserSubscription.objects.filter(user=request.user).update(active=False, end_date=timezone.now())
+            stripe.Subscription.delete(sub_id)
+            UserSubscription.objects.filter(user=request.user).update(
+                active=False, end_date=timezone.now(), checkout_key=None
+            )
             return Response({"message": "Subscription canceled immediately."}, status=status.HTTP_200_OK)
         except stripe.error.StripeError as e:
             return Response({"detail": "Stripe error.", "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -228,11 +335,12 @@ class MySubscriptionView(APIView):
 
 
 class ListUserSubscriptionsView(ListAPIView):
-    queryset = UserSubscription.objects.select_related("user", "plan").all().order_by("-start_date")
+    queryset = UserSubscription.objects.select_related("plan").order_by("-start_date")
     serializer_class = UserSubscriptionSerializer
     permission_classes = [IsAdminUser]
 
 
+@method_decorator([cache_page(60 * 5), cache_control(public=True)], name="dispatch")
 class ListPlansView(ListAPIView):
     queryset = SubscriptionPlan.objects.all().order_by("price")
     serializer_class = SubscriptionPlanSerializer
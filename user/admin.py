@@ -2,6 +2,8 @@ from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm
+from django.db.models import BooleanField, Case, Value, When
+from django.db.models.functions import Coalesce, Now
 from django.utils import timezone
 from django.utils.html import format_html
 
@@ -23,7 +25,25 @@ class CustomUserChangeForm(UserChangeForm):
 
     class Meta(UserChangeForm.Meta):
         model = CustomUser
-        fields = "__all__"
+        fields = (
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "phone_number",
+            "profile_image",
+            "is_verified",
+            "is_provider",
+            "is_professional",
+            "failed_login_attempts",
+            "locked_until",
+            "stripe_customer_id",
+            "is_active",
+            "is_staff",
+            "is_superuser",
+            "groups",
+            "user_permissions",
+        )
 
     def clean(self):
         cleaned = super().clean()
@@ -50,7 +70,7 @@ class LockedStatusFilter(admin.SimpleListFilter):
         if val == "yes":
             return queryset.filter(locked_until__gt=now)
         if val == "no":
-            return queryset.filter((~admin.models.Q(locked_until__gt=now)) | admin.models.Q(locked_until__isnull=True))
+            return queryset.exclude(locked_until__gt=now)
         return queryset
 
 
@@ -84,7 +104,7 @@ class CustomUserAdmin(UserAdmin):
         LockedStatusFilter,
         "date_joined",
     )
-    search_fields = ("email", "first_name", "last_name", "phone_number", "stripe_customer_id")
+    search_fields = ("^email", "^first_name", "^last_name", "=phone_number", "=stripe_customer_id")
     ordering = ("email",)
     date_hierarchy = "date_joined"
     actions = ["unlock_accounts", "mark_verified", "mark_unverified", "reset_login_failures"]
@@ -124,15 +144,24 @@ class CustomUserAdmin(UserAdmin):
 
     readonly_fields = ("date_joined", "last_login", "email_verified_at")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _is_locked=Case(
+                When(locked_until__gt=Now(), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+        )
+
     def save_model(self, request, obj, form, change):
         new_pw = form.cleaned_data.get("new_password1")
         if new_pw:
             obj.set_password(new_pw)
         super().save_model(request, obj, form, change)
 
-    @admin.display(description="Locked", boolean=True)
+    @admin.display(description="Locked", boolean=True, ordering="_is_locked")
     def is_locked_display(self, obj):
-        return obj.is_locked
+        return obj._is_locked
 
     @admin.display(description="Avatar")
     def avatar(self, obj):
@@ -146,13 +175,10 @@ class CustomUserAdmin(UserAdmin):
 
     @admin.action(description="Mark selected as verified")
     def mark_verified(self, request, queryset):
-        now = timezone.now()
-        for u in queryset:
-            if not u.is_verified:
-                u.is_verified = True
-                if not u.email_verified_at:
-                    u.email_verified_at = now
-                u.save(update_fields=["is_verified", "email_verified_at"])
+        queryset.filter(is_verified=False).update(
+            is_verified=True,
+            email_verified_at=Coalesce("email_verified_at", Value(timezone.now())),
+        )
 
     @admin.action(description="Mark selected as unverified")
     def mark_unverified(self, request, queryset):
@@ -194,8 +220,9 @@ class OneTimeCodeAdmin(admin.ModelAdmin):
         "max_attempts",
     )
     list_filter = ("purpose", ActiveCodeFilter, "used_at", "expires_at", "created_at")
-    search_fields = ("user__email", "new_email")
+    search_fields = ("^user__email", "^new_email")
     ordering = ("-created_at",)
+    list_select_related = ("user",)
     readonly_fields = ("user", "purpose", "new_email", "code_hash", "created_at", "expires_at", "used_at", "verify_attempts", "max_attempts")
     actions = ["expire_now", "reset_attempts"]
     fieldsets = (
@@ -211,18 +238,27 @@ class OneTimeCodeAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
-    @admin.display(description="Active", boolean=True)
+    def get_queryset(self, request):
+        # The joined user row is only rendered through its email; skip the
+        # password, profile and billing columns.
+        return super().get_queryset(request).only(
+            "user", "user__email", "purpose", "new_email", "created_at",
+            "expires_at", "used_at", "verify_attempts", "max_attempts",
+        ).annotate(
+            _is_active=Case(
+                When(used_at__isnull=True, expires_at__gt=Now(), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            )
+        )
+
+    @admin.display(description="Active", boolean=True, ordering="_is_active")
     def is_active_display(self, obj):
-        now = timezone.now()
-        return obj.used_at is None and obj.expires_at > now
+        return obj._is_active
 
     @admin.action(description="Expire selected codes now")
     def expire_now(self, request, queryset):
-        now = timezone.now()
-        for code in queryset:
-            if code.used_at is None:
-                code.used_at = now
-                code.save(update_fields=["used_at"])
+        queryset.filter(used_at__isnull=True).update(used_at=timezone.now())
 
     @admin.action(description="Reset verify attempts to 0")
     def reset_attempts(self, request, queryset):
@@ -1,10 +1,13 @@
 from rest_framework.views import exception_handler
 
+DEFAULT_DETAIL = "Request could not be processed."
+
 def custom_exception_handler(exc, context):
     response = exception_handler(exc, context)
     if response is not None:
-        if isinstance(response.data, list):
-            response.data = {"detail": response.data[0]}
-        elif "detail" not in response.data:
-            response.data = {"detail": "Request could not be processed."}
+        data = response.data
+        if isinstance(data, list):
+            response.data = {"detail": data[0] if data else DEFAULT_DETAIL}
+        elif data.get("detail") is None:
+            response.data = {"detail": DEFAULT_DETAIL}
     return response
@@ -10,10 +10,18 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--batch-size", type=int, default=1000)
 
     def handle(self, *args, **opts):
         cutoff = timezone.now() - timedelta(days=opts["days"])
         qs = User.objects.filter(is_verified=False, date_joined__lt=cutoff)
-        count = qs.count()
-        qs.delete()
+        count = 0
+        # Delete in id batches so the cascade collector only ever holds one
+        # batch of users (and their codes, ratings, tokens) in memory.
+        while True:
+            ids = list(qs.values_list("pk", flat=True)[:opts["batch_size"]])
+            if not ids:
+                break
+            _, per_model = User.objects.filter(pk__in=ids).delete()
+            count += per_model.get(User._meta.label, 0)
         self.stdout.write(self.style.SUCCESS(f"Deleted {count} unverified accounts older than {opts['days']} days."))
@@ -2,20 +2,22 @@ from datetime import timedelta
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models, transaction
-from django.db.models import Q
+from django.db.models import Case, F, Q, Value, When
 from django.db.models.functions import Lower
 from django.utils import timezone
 from django.core.validators import RegexValidator, MinLengthValidator
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import check_password
 from django.core.exceptions import ValidationError
-from django.contrib.auth import get_user_model
 
+import hashlib
+import hmac
+import re
 import secrets
-import os
-from datetime import datetime
+
+_PHONE_RE = re.compile(r"^\+?\d{7,15}$")
 
 phone_validator = RegexValidator(
-    regex=r"^\+?\d{7,15}$",
+    regex=_PHONE_RE,
     message='Enter a valid phone number (7-15 digits, optional leading "+").',
 )
 
@@ -34,10 +36,11 @@ def validate_image_format(image):
         raise ValidationError("Profile image must be PNG, JPG, JPEG, or WEBP.")
 
 def profile_image_upload_to(instance, filename):
-    now = datetime.now()
-    base_filename = f"{(instance.first_name or 'user')}_{(instance.last_name or 'img')}_{now.strftime('%Y%m%d_%H%M%S')}"
+    now = timezone.now()
+    month, stamp = now.strftime("%B|%Y%m%d_%H%M%S").split("|")
+    base_filename = f"{(instance.first_name or 'user')}_{(instance.last_name or 'img')}_{stamp}"
     ext = filename.split(".")[-1]
-    return os.path.join(str(now.year), now.strftime("%B"), str(now.day), f"{base_filename}.{ext}")
+    return f"{now.year}/{month}/{now.day}/{base_filename}.{ext}"
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -99,6 +102,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         ordering = ["email"]
+        indexes = [
+            models.Index(fields=["locked_until"], name="ix_user_locked_until", condition=Q(locked_until__isnull=False)),
+        ]
 
     def save(self, *args, **kwargs):
         if self.email:
@@ -117,11 +123,17 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return f"{(self.first_name or '').strip()} {(self.last_name or '').strip()}".strip() or None
 
     def register_failed_login(self, threshold=5, lock_minutes=15):
-        self.failed_login_attempts = (self.failed_login_attempts or 0) + 1
-        self.last_login_failure = timezone.now()
-        if self.failed_login_attempts >= threshold:
-            self.locked_until = timezone.now() + timedelta(minutes=lock_minutes)
-        self.save(update_fields=["failed_login_attempts", "last_login_failure", "locked_until"])
+        # Increment in the database so concurrent failures are all counted.
+        # The SET expressions see the pre-update count, hence threshold - 1.
+        now = timezone.now()
+        type(self).objects.filter(pk=self.pk).update(
+            failed_login_attempts=F("failed_login_attempts") + 1,
+            last_login_failure=now,
+            locked_until=Case(
+                When(failed_login_attempts__gte=threshold - 1, then=Value(now + timedelta(minutes=lock_minutes))),
+                default=F("locked_until"),
+            ),
+        )
 
     def reset_login_failures(self):
         if self.failed_login_attempts or self.locked_until or self.last_login_failure:
@@ -150,6 +162,14 @@ class OneTimeCode(models.Model):
         (PURPOSE_REACTIVATE, 'Account Reactivation'),
     ]
 
+    _DEFAULT_TTL = timedelta(minutes=10)
+    _TTL_MAP = {
+        PURPOSE_RESET: timedelta(minutes=15),
+        PURPOSE_EMAIL: timedelta(minutes=30),
+        PURPOSE_UNLOCK: timedelta(minutes=10),
+        PURPOSE_REACTIVATE: timedelta(minutes=15),
+    }
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='one_time_codes')
     purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
     code_hash = models.CharField(max_length=128, editable=False)
@@ -168,6 +188,7 @@ class OneTimeCode(models.Model):
             models.Index(fields=['user', 'purpose']),
             models.Index(fields=['expires_at']),
             models.Index(fields=['used_at']),
+            models.Index(fields=['expires_at'], name='ix_otc_active', condition=Q(used_at__isnull=True)),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -182,20 +203,23 @@ class OneTimeCode(models.Model):
 
     @classmethod
     def _generate_numeric_code(cls, length=6) -> str:
-        alphabet = '0123456789'
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+        return f"{secrets.randbelow(10 ** length):0{length}d}"
+
+    @staticmethod
+    def _hash_code(raw_code: str) -> str:
+        pepper = settings.OTP_HMAC_PEPPER.encode()
+        return hmac.new(pepper, raw_code.encode(), hashlib.sha256).hexdigest()
+
+    def check_code(self, raw_code: str) -> bool:
+        # Codes issued before the switch to HMAC carry a make_password()
+        # hash ("algorithm$..."); those expire within minutes of a deploy.
+        if "$" in self.code_hash:
+            return check_password(raw_code, self.code_hash)
+        return hmac.compare_digest(self.code_hash, self._hash_code(raw_code))
 
     @classmethod
     def _default_ttl(cls, purpose):
-        if purpose == cls.PURPOSE_RESET:
-            return timedelta(minutes=15)
-        if purpose == cls.PURPOSE_EMAIL:
-            return timedelta(minutes=30)
-        if purpose == cls.PURPOSE_UNLOCK:
-            return timedelta(minutes=10)
-        if purpose == cls.PURPOSE_REACTIVATE:
-            return timedelta(minutes=15)
-        return timedelta(minutes=10)
+        return cls._TTL_MAP.get(purpose, cls._DEFAULT_TTL)
 
     @classmethod
     def issue(cls, *, user, purpose, new_email=None, length=6, ttl=None) -> "OneTimeCode":
@@ -205,22 +229,30 @@ class OneTimeCode(models.Model):
             new_email = new_email.lower()
             if user.email and user.email.lower() == new_email:
                 raise ValidationError({'new_email': 'New email must be different from current email.'})
+            if CustomUser.objects.filter(email=new_email).exists():
+                raise ValidationError({'new_email': 'This email is already in use.'})
 
         raw_code = cls._generate_numeric_code(length=length)
-        expires_at = timezone.now() + (ttl or cls._default_ttl(purpose))
+        now = timezone.now()
+        expires_at = now + (ttl or cls._default_ttl(purpose))
 
         with transaction.atomic():
-            cls.objects.select_for_update().filter(user=user, purpose=purpose, used_at__isnull=True)\
-                .update(used_at=timezone.now())
+            # The UPDATE takes the row locks itself; a separate
+            # select_for_update() adds nothing here.
+            cls.objects.filter(user=user, purpose=purpose, used_at__isnull=True).update(used_at=now)
 
             obj = cls(
                 user=user,
                 purpose=purpose,
-                code_hash=make_password(raw_code),
+                code_hash=cls._hash_code(raw_code),
                 new_email=new_email.lower() if new_email else None,
                 expires_at=expires_at,
             )
-            obj.full_clean()
+            # The user comes from the caller and the active-code constraint was
+            # just cleared above, so skip the FK and constraint lookups that
+            # full_clean() would run.
+            obj.clean_fields(exclude=["user", "code_hash"])
+            obj.clean()
             obj.save()
 
         obj.raw_code = raw_code
@@ -244,15 +276,14 @@ class OneTimeCode(models.Model):
         if self.purpose != self.PURPOSE_EMAIL and self.new_email:
             raise ValidationError({'new_email': 'new_email must be empty unless purpose is email update.'})
 
-        if self.purpose == self.PURPOSE_EMAIL and self.new_email:
-            User = get_user_model()
-            if User.objects.filter(email__iexact=self.new_email).exists():
-                raise ValidationError({'new_email': 'This email is already in use.'})
-
     def verify(self, raw_code: str) -> bool:
+        # check_code compares digests in constant time; hashing on the
+        # early-exit path keeps a used or expired code from answering
+        # measurably faster than a wrong one.
         if self.is_used or self.is_expired:
+            self._hash_code(raw_code)
             return False
-        return check_password(raw_code, self.code_hash)
+        return self.check_code(raw_code)
 
     def mark_used(self):
         if not self.is_used:
@@ -265,11 +296,12 @@ class OneTimeCode(models.Model):
             code = cls.objects.select_for_update().active().filter(user=user, purpose=purpose).first()
             if not code:
                 return False
+            # Cheap invariants first: an exhausted code never reaches the KDF.
             if code.verify_attempts >= code.max_attempts:
                 code.used_at = timezone.now()
                 code.save(update_fields=["verify_attempts", "used_at"])
                 return False
-            ok = check_password(raw_code, code.code_hash)
+            ok = code.check_code(raw_code)
             code.verify_attempts += 1
             if ok:
                 code.used_at = timezone.now()
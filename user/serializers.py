@@ -2,21 +2,62 @@ from datetime import timedelta
 
 from django.utils import timezone
 from django.contrib.auth import get_user_model, password_validation
+from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.db import transaction, IntegrityError
+from django.db.models import Count, Max, Min
 from django.core.exceptions import ValidationError as DjangoValidationError
-from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import update_last_login
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework import serializers
 
 from .models import OneTimeCode
-from .services.otp_utils import can_resend, issue_otp
-from .services.email_utils import send_otp_email
+from .services.otp_utils import can_resend, cache_is_shared, issue_otp, last_issued_cache_key
+from .services.email_utils import send_otp_email, send_otp_email_on_commit
 from .utils.tokens import blacklist_user_tokens
 
 User = get_user_model()
 
 
+def _user_and_latest_code(email, purpose):
+    # One joined query covers the common case; the bare user lookup only
+    # runs when no code of this purpose was ever issued.
+    code_obj = (
+        OneTimeCode.objects
+        .select_related("user")
+        .filter(user__email=email, purpose=purpose)
+        .order_by("-created_at")
+        .first()
+    )
+    if code_obj is not None:
+        return code_obj.user, code_obj
+    return User.objects.filter(email=email).first(), None
+
+
+def _last_code_issued_at(user, purpose):
+    # issue_otp() records each issuance in the cache, so with a shared cache
+    # repeated requests during a cooldown skip the database.
+    last = cache.get(last_issued_cache_key(user.pk, purpose)) if cache_is_shared() else None
+    if last is None:
+        last = OneTimeCode.objects.filter(user=user, purpose=purpose).aggregate(last=Max("created_at"))["last"]
+    return last
+
+
+def _daily_codes(user, purpose, now):
+    # Number of codes issued in the trailing 24h and when the oldest of them was.
+    stats = OneTimeCode.objects.filter(
+        user=user, purpose=purpose, created_at__gte=now - timedelta(days=1)
+    ).aggregate(n=Count("id"), first=Min("created_at"))
+    return stats["n"], stats["first"]
+
+
+def _seconds_left(since, window, now=None):
+    if since is None:
+        return 0
+    return max(0, int(window - ((now or timezone.now()) - since).total_seconds()))
+
+
 class RegisterSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True, min_length=8, trim_whitespace=False)
@@ -66,9 +107,8 @@ class VerifyEmailOTPSerializer(serializers.Serializer):
         email = attrs["email"].lower()
         raw_code = attrs["code"].strip()
 
-        try:
-            user = User.objects.get(email__iexact=email)
-        except User.DoesNotExist:
+        user, code_obj = _user_and_latest_code(email, OneTimeCode.PURPOSE_LOGIN)
+        if user is None:
             raise serializers.ValidationError({
                 "detail": self.default_error_messages["no_user"],
                 "reason": "no_user",
@@ -80,12 +120,6 @@ class VerifyEmailOTPSerializer(serializers.Serializer):
             attrs["already_verified"] = True
             return attrs
 
-        code_obj = (
-            OneTimeCode.objects
-            .filter(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
-            .order_by("-created_at")
-            .first()
-        )
         if not code_obj:
             allow_resend = can_resend(user.id, OneTimeCode.PURPOSE_LOGIN, limit=1, window=60)
             raise serializers.ValidationError({
@@ -152,23 +186,17 @@ class ResendOTPSerializer(serializers.Serializer):
         attrs["already_verified"] = bool(user and user.is_verified)
         if not user or attrs["already_verified"]:
             return attrs
-        last = (
-            OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
-            .order_by("-created_at")
-            .first()
-        )
-        if last:
-            elapsed = (timezone.now() - last.created_at).total_seconds()
-            remaining = max(0, int(self.COOLDOWN_SECONDS - elapsed))
-            if remaining > 0:
-                raise serializers.ValidationError(
-                    {
-                        "detail": f"Please wait {remaining} second(s) before requesting another code.",
-                        "reason": "cooldown_active",
-                        "seconds_left": remaining,
-                        "next_action": "wait_and_retry",
-                    }
-                )
+        attrs["_last_created_at"] = _last_code_issued_at(user, OneTimeCode.PURPOSE_LOGIN)
+        remaining = _seconds_left(attrs["_last_created_at"], self.COOLDOWN_SECONDS)
+        if remaining > 0:
+            raise serializers.ValidationError(
+                {
+                    "detail": f"Please wait {remaining} second(s) before requesting another code.",
+                    "reason": "cooldown_active",
+                    "seconds_left": remaining,
+                    "next_action": "wait_and_retry",
+                }
+            )
         return attrs
 
     def save(self, **kwargs):
@@ -182,15 +210,7 @@ class ResendOTPSerializer(serializers.Serializer):
                 "next_action": "login",
             }
         if not can_resend(user.id, OneTimeCode.PURPOSE_LOGIN, limit=1, window=self.COOLDOWN_SECONDS):
-            last = (
-                OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
-                .order_by("-created_at")
-                .first()
-            )
-            remaining = 0
-            if last:
-                elapsed = (timezone.now() - last.created_at).total_seconds()
-                remaining = max(0, int(self.COOLDOWN_SECONDS - elapsed))
+            remaining = _seconds_left(self.validated_data["_last_created_at"], self.COOLDOWN_SECONDS)
             raise serializers.ValidationError(
                 {
                     "detail": "Please wait before requesting another code.",
@@ -200,7 +220,7 @@ class ResendOTPSerializer(serializers.Serializer):
                 }
             )
         obj, code, ttl_min = issue_otp(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
-        send_otp_email(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="verify")
+        send_otp_email_on_commit(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="verify")
         return {
             "detail": "Verification code sent.",
             "email": user.email,
@@ -222,13 +242,10 @@ class PasswordResetRequestSerializer(serializers.Serializer):
             return attrs
 
         now = timezone.now()
-        day_ago = now - timedelta(days=1)
-        recent_qs = OneTimeCode.objects.filter(
-            user=user, purpose=OneTimeCode.PURPOSE_RESET, created_at__gte=day_ago
-        )
-        if recent_qs.count() >= self.DAILY_LIMIT:
-            first_in_window = recent_qs.order_by("created_at").first()
-            remaining = max(0, int(86400 - (now - first_in_window.created_at).total_seconds()))
+        attrs["_last_created_at"] = _last_code_issued_at(user, OneTimeCode.PURPOSE_RESET)
+        daily_count, first_in_window = _daily_codes(user, OneTimeCode.PURPOSE_RESET, now)
+        if daily_count >= self.DAILY_LIMIT:
+            remaining = _seconds_left(first_in_window, 86400, now)
             raise serializers.ValidationError(
                 {
                     "detail": "Daily password reset limit reached. Try again later.",
@@ -238,23 +255,16 @@ class PasswordResetRequestSerializer(serializers.Serializer):
                 }
             )
 
-        last = (
-            OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-            .order_by("-created_at")
-            .first()
-        )
-        if last:
-            elapsed = (now - last.created_at).total_seconds()
-            remaining = max(0, int(self.COOLDOWN_SECONDS - elapsed))
-            if remaining > 0:
-                raise serializers.ValidationError(
-                    {
-                        "detail": f"Please wait {remaining} second(s) before requesting another reset code.",
-                        "reason": "cooldown_active",
-                        "seconds_left": remaining,
-                        "next_action": "wait_and_retry",
-                    }
-                )
+        remaining = _seconds_left(attrs["_last_created_at"], self.COOLDOWN_SECONDS, now)
+        if remaining > 0:
+            raise serializers.ValidationError(
+                {
+                    "detail": f"Please wait {remaining} second(s) before requesting another reset code.",
+                    "reason": "cooldown_active",
+                    "seconds_left": remaining,
+                    "next_action": "wait_and_retry",
+                }
+            )
 
         return attrs
 
@@ -264,15 +274,7 @@ class PasswordResetRequestSerializer(serializers.Serializer):
             return {"detail": "If an account exists, a reset code was sent."}
 
         if not can_resend(user.id, OneTimeCode.PURPOSE_RESET, limit=1, window=self.COOLDOWN_SECONDS):
-            last = (
-                OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-                .order_by("-created_at")
-                .first()
-            )
-            remaining = 0
-            if last:
-                elapsed = (timezone.now() - last.created_at).total_seconds()
-                remaining = max(0, int(self.COOLDOWN_SECONDS - elapsed))
+            remaining = _seconds_left(self.validated_data["_last_created_at"], self.COOLDOWN_SECONDS)
             raise serializers.ValidationError(
                 {
                     "detail": "Please wait before requesting another reset code.",
@@ -283,7 +285,7 @@ class PasswordResetRequestSerializer(serializers.Serializer):
             )
 
         obj, code, ttl_min = issue_otp(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-        send_otp_email(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="reset")
+        send_otp_email_on_commit(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="reset")
         return {
             "detail": "Password reset code sent.",
             "email": user.email,
@@ -312,17 +314,10 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         raw_code = attrs["code"].strip()
         new_password = attrs["new_password"]
 
-        try:
-            user = User.objects.get(email__iexact=email)
-        except User.DoesNotExist:
+        user, code_obj = _user_and_latest_code(email, OneTimeCode.PURPOSE_RESET)
+        if user is None:
             raise serializers.ValidationError({"detail": self.default_error_messages["no_user"], "reason": "no_user"})
 
-        code_obj = (
-            OneTimeCode.objects
-            .filter(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-            .order_by("-created_at")
-            .first()
-        )
         if not code_obj:
             raise serializers.ValidationError({"detail": self.default_error_messages["no_code"], "reason": "no_code"})
         if code_obj.is_used:
@@ -377,24 +372,20 @@ class PasswordResetResendOTPSerializer(serializers.Serializer):
 
         now = timezone.now()
 
-        recent_success = (
-            OneTimeCode.objects
-            .filter(user=user, purpose=OneTimeCode.PURPOSE_RESET, used_at__isnull=False)
-            .order_by("-used_at")
-            .first()
+        stamps = OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_RESET).aggregate(
+            last_created=Max("created_at"), last_used=Max("used_at"),
         )
-        if recent_success:
-            elapsed = (now - recent_success.used_at).total_seconds()
-            remaining = max(0, int(self.SUCCESS_LOCK_SECONDS - elapsed))
-            if remaining > 0:
-                raise serializers.ValidationError(
-                    {
-                        "detail": "Password was recently reset. For security, request again later.",
-                        "reason": "recently_reset",
-                        "seconds_left": remaining,
-                        "next_action": "wait_and_retry",
-                    }
-                )
+        attrs["_last_created_at"] = stamps["last_created"]
+        remaining = _seconds_left(stamps["last_used"], self.SUCCESS_LOCK_SECONDS, now)
+        if remaining > 0:
+            raise serializers.ValidationError(
+                {
+                    "detail": "Password was recently reset. For security, request again later.",
+                    "reason": "recently_reset",
+                    "seconds_left": remaining,
+                    "next_action": "wait_and_retry",
+                }
+            )
 
         active = (
             OneTimeCode.objects.active()
@@ -413,21 +404,9 @@ class PasswordResetResendOTPSerializer(serializers.Serializer):
                 }
             )
 
-        day_ago = now - timedelta(days=1)
-        daily_count = OneTimeCode.objects.filter(
-            user=user, purpose=OneTimeCode.PURPOSE_RESET, created_at__gte=day_ago
-        ).count()
+        daily_count, first_in_window = _daily_codes(user, OneTimeCode.PURPOSE_RESET, now)
         if daily_count >= self.DAILY_LIMIT:
-            first_in_window = (
-                OneTimeCode.objects.filter(
-                    user=user, purpose=OneTimeCode.PURPOSE_RESET, created_at__gte=day_ago
-                )
-                .order_by("created_at")
-                .first()
-            )
-            remaining = 0
-            if first_in_window:
-                remaining = max(0, int(86400 - (now - first_in_window.created_at).total_seconds()))
+            remaining = _seconds_left(first_in_window, 86400, now)
             raise serializers.ValidationError(
                 {
                     "detail": "Daily password reset limit reached. Try again later.",
@@ -437,23 +416,16 @@ class PasswordResetResendOTPSerializer(serializers.Serializer):
                 }
             )
 
-        last = (
-            OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-            .order_by("-created_at")
-            .first()
-        )
-        if last:
-            elapsed = (now - last.created_at).total_seconds()
-            remaining = max(0, int(self.COOLDOWN_SECONDS - elapsed))
-            if remaining > 0:
-                raise serializers.ValidationError(
-                    {
-                        "detail": f"Please wait {remaining} second(s) before requesting another reset code.",
-                        "reason": "cooldown_active",
-                        "seconds_left": remaining,
-                        "next_action": "wait_and_retry",
-                    }
-                )
+        remaining = _seconds_left(attrs["_last_created_at"], self.COOLDOWN_SECONDS, now)
+        if remaining > 0:
+            raise serializers.ValidationError(
+                {
+                    "detail": f"Please wait {remaining} second(s) before requesting another reset code.",
+                    "reason": "cooldown_active",
+                    "seconds_left": remaining,
+                    "next_action": "wait_and_retry",
+                }
+            )
 
         return attrs
 
@@ -463,15 +435,7 @@ class PasswordResetResendOTPSerializer(serializers.Serializer):
             return {"detail": "If an account exists, a reset code was sent."}
 
         if not can_resend(user.id, OneTimeCode.PURPOSE_RESET, limit=1, window=self.COOLDOWN_SECONDS):
-            last = (
-                OneTimeCode.objects.filter(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-                .order_by("-created_at")
-                .first()
-            )
-            remaining = 0
-            if last:
-                elapsed = (timezone.now() - last.created_at).total_seconds()
-                remaining = max(0, int(self.COOLDOWN_SECONDS - elapsed))
+            remaining = _seconds_left(self.validated_data["_last_created_at"], self.COOLDOWN_SECONDS)
             raise serializers.ValidationError(
                 {
                     "detail": "Please wait before requesting another reset code.",
@@ -482,7 +446,7 @@ class PasswordResetResendOTPSerializer(serializers.Serializer):
             )
 
         obj, code, ttl_min = issue_otp(user=user, purpose=OneTimeCode.PURPOSE_RESET)
-        send_otp_email(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="reset")
+        send_otp_email_on_commit(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="reset")
         return {
             "detail": "Password reset code sent.",
             "email": user.email,
@@ -524,10 +488,7 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         if not user.is_verified:
             obj, code, ttl_min = issue_otp(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
-            try:
-                send_otp_email(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="verify")
-            except Exception:
-                pass
+            send_otp_email_on_commit(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="verify")
             raise serializers.ValidationError({
                 "detail": "Email not verified. We sent you a new verification code.",
                 "requires_verification": True,
@@ -539,7 +500,13 @@ class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
         if hasattr(user, "reset_login_failures"):
             user.reset_login_failures()
 
-        data = super().validate({self.username_field: email, "password": password})
+        # The password was checked above; going through super().validate()
+        # would authenticate() and run the hasher a second time.
+        self.user = user
+        refresh = self.get_token(user)
+        data = {"refresh": str(refresh), "access": str(refresh.access_token)}
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
         data.update({
             "user": {
                 "id": str(user.pk),
@@ -596,7 +563,7 @@ class UnlockRequestSerializer(serializers.Serializer):
         if not can_resend(user.id, OneTimeCode.PURPOSE_UNLOCK, limit=1, window=60):
             raise serializers.ValidationError({"detail": "Please wait before requesting another code."})
         obj, code, ttl_min = issue_otp(user=user, purpose=OneTimeCode.PURPOSE_UNLOCK)
-        send_otp_email(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="unlock")
+        send_otp_email_on_commit(to_email=user.email, code=code, ttl_minutes=ttl_min, purpose="unlock")
 
 
 class EmailUpdateConfirmSerializer(serializers.Serializer):
@@ -621,7 +588,7 @@ class EmailUpdateConfirmSerializer(serializers.Serializer):
             )
             if not code_obj:
                 raise serializers.ValidationError({"detail": self.default_error_messages["no_code"], "reason": "no_code"})
-            if not check_password(raw, code_obj.code_hash):
+            if not code_obj.check_code(raw):
                 raise serializers.ValidationError({"detail": self.default_error_messages["invalid_code"], "reason": "invalid"})
             new_email = (code_obj.new_email or "").lower()
             if not new_email:
@@ -704,19 +671,9 @@ class EmailUpdateResendOTPSerializer(serializers.Serializer):
                     "next_action": "wait_and_retry",
                 })
 
-        day_ago = now - timedelta(days=1)
-        daily_count = OneTimeCode.objects.filter(
-            user=user, purpose=OneTimeCode.PURPOSE_EMAIL, created_at__gte=day_ago
-        ).count()
+        daily_count, first_in_window = _daily_codes(user, OneTimeCode.PURPOSE_EMAIL, now)
         if daily_count >= self.DAILY_LIMIT:
-            first_in_window = (
-                OneTimeCode.objects.filter(
-                    user=user, purpose=OneTimeCode.PURPOSE_EMAIL, created_at__gte=day_ago
-                ).order_by("created_at").first()
-            )
-            remaining = 0
-            if first_in_window:
-                remaining = max(0, int(86400 - (now - first_in_window.created_at).total_seconds()))
+            remaining = _seconds_left(first_in_window, 86400, now)
             raise serializers.ValidationError({
                 "detail": "Daily email update limit reached. Try again later.",
                 "reason": "daily_limit",
@@ -822,19 +779,9 @@ class EmailUpdateRequestSerializer(serializers.Serializer):
                 "next_action": "use_existing_code",
             })
 
-        day_ago = now - timedelta(days=1)
-        daily_count = OneTimeCode.objects.filter(
-            user=user, purpose=OneTimeCode.PURPOSE_EMAIL, created_at__gte=day_ago
-        ).count()
+        daily_count, first_in_window = _daily_codes(user, OneTimeCode.PURPOSE_EMAIL, now)
         if daily_count >= self.DAILY_LIMIT:
-            first_in_window = (
-                OneTimeCode.objects.filter(
-                    user=user, purpose=OneTimeCode.PURPOSE_EMAIL, created_at__gte=day_ago
-                ).order_by("created_at").first()
-            )
-            remaining = 0
-            if first_in_window:
-                remaining = max(0, int(86400 - (now - first_in_window.created_at).total_seconds()))
+            remaining = _seconds_left(first_in_window, 86400, now)
             raise serializers.ValidationError({
                 "detail": "Daily email update request limit reached. Try again later.",
                 "reason": "daily_limit",
@@ -1045,7 +992,7 @@ class ReactivateAccountConfirmSerializer(serializers.Serializer):
             .order_by("-created_at")
             .first()
         )
-        if not code_obj or not check_password(raw, code_obj.code_hash):
+        if not code_obj or not code_obj.check_code(raw):
             raise serializers.ValidationError({"detail": self.default_error_messages["invalid_code"], "reason": "invalid"})
         attrs["user"] = user
         attrs["code_obj"] = code_obj
@@ -1,12 +1,18 @@
+import logging
+import threading
+
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import transaction
 
 PROJECT_NAME = getattr(settings, "PROJECT_NAME", "Muzzomo")
 BRAND_LOGO_URL = getattr(settings, "BRAND_LOGO_URL", "https://via.placeholder.com/120x40?text=Logo")
 SUPPORT_EMAIL = getattr(settings, "SUPPORT_EMAIL", settings.DEFAULT_FROM_EMAIL)
 
+logger = logging.getLogger(__name__)
+
 def send_plain_email(*, to_email: str, subject: str, body: str) -> None:
     if not to_email:
         raise ValueError("to_email is required")
@@ -81,3 +87,17 @@ def send_otp_email(
     )
     msg.attach_alternative(html_body, "text/html")
     msg.send(fail_silently=False)
+
+def _send_otp_email_logged(**kwargs) -> None:
+    try:
+        send_otp_email(**kwargs)
+    except Exception:
+        logger.exception("Failed to send %s OTP email to %s", kwargs.get("purpose"), kwargs.get("to_email"))
+
+def send_otp_email_on_commit(**kwargs) -> None:
+    # Keep the SMTP round-trip off the request: send from a daemon thread
+    # once the code row is committed. The caller has already answered, so
+    # failures can only be logged.
+    transaction.on_commit(
+        lambda: threading.Thread(target=_send_otp_email_logged, kwargs=kwargs, daemon=True).start()
+    )
@@ -1,10 +1,24 @@
 from typing import Tuple, Optional
 
+from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
+from django.db import transaction
 
 from ..models import OneTimeCode
 
+# Outlives the resend cooldowns; a miss simply falls back to the database.
+LAST_ISSUED_CACHE_TIMEOUT = 300
+
+def last_issued_cache_key(user_id, purpose):
+    return f"otp_last:{purpose}:{user_id}"
+
+def cache_is_shared():
+    # A per-process cache may hold an older issue time than another worker
+    # just wrote, which would shorten the cooldown; only trust shared ones.
+    backend = settings.CACHES["default"]["BACKEND"]
+    return not backend.endswith((".LocMemCache", ".DummyCache"))
+
 def issue_otp(
     *, 
     user, 
@@ -17,6 +31,10 @@ def issue_otp(
         user=user, purpose=purpose, new_email=new_email, length=length, ttl=ttl
     )
     raw = getattr(obj, "raw_code", None)
+    if cache_is_shared():
+        transaction.on_commit(lambda: cache.set(
+            last_issued_cache_key(user.pk, purpose), obj.created_at, timeout=LAST_ISSUED_CACHE_TIMEOUT
+        ))
 
     delta = (obj.expires_at - obj.created_at)
     ttl_minutes = max(1, int(delta.total_seconds() // 60))
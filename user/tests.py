@@ -1,3 +1,55 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from .models import OneTimeCode
+from .serializers import _last_code_issued_at
+from .services.otp_utils import issue_otp, last_issued_cache_key
+
+User = get_user_model()
+
+
+class LastCodeIssuedAtTests(TestCase):
+    def test_per_process_cache_cannot_shorten_cooldown(self):
+        user = User.objects.create_user(email="otp@example.com", password="pw-12345678")
+        obj, _, _ = issue_otp(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
+        stale = obj.created_at - timedelta(minutes=10)
+        cache.set(last_issued_cache_key(user.pk, OneTimeCode.PURPOSE_LOGIN), stale)
+
+        self.assertEqual(_last_code_issued_at(user, OneTimeCode.PURPOSE_LOGIN), obj.created_at)
+
+    def test_per_process_cache_is_not_written(self):
+        user = User.objects.create_user(email="otp@example.com", password="pw-12345678")
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_otp(user=user, purpose=OneTimeCode.PURPOSE_LOGIN)
+        self.assertIsNone(cache.get(last_issued_cache_key(user.pk, OneTimeCode.PURPOSE_LOGIN)))
+
+
+class OneTimeCodeHashTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="code@example.com", password="pw-12345678")
+
+    def test_codes_are_stored_as_hmac(self):
+        obj = OneTimeCode.issue(user=self.user, purpose=OneTimeCode.PURPOSE_RESET)
+        self.assertNotIn("$", obj.code_hash)
+        self.assertNotIn(obj.raw_code, obj.code_hash)
+        self.assertTrue(obj.check_code(obj.raw_code))
+        self.assertFalse(obj.check_code("not-it"))
+
+    def test_legacy_password_hashes_still_verify(self):
+        obj = OneTimeCode.issue(user=self.user, purpose=OneTimeCode.PURPOSE_RESET)
+        OneTimeCode.objects.filter(pk=obj.pk).update(code_hash=make_password("123456"))
+        obj.refresh_from_db()
+        self.assertTrue(obj.check_code("123456"))
+        self.assertFalse(obj.check_code("654321"))
+
+    def test_verify_and_consume_uses_the_hmac(self):
+        obj = OneTimeCode.issue(user=self.user, purpose=OneTimeCode.PURPOSE_RESET)
+        purpose = OneTimeCode.PURPOSE_RESET
+        self.assertFalse(OneTimeCode.verify_and_consume(user=self.user, purpose=purpose, raw_code="wrong"))
+        self.assertTrue(OneTimeCode.verify_and_consume(user=self.user, purpose=purpose, raw_code=obj.raw_code))
+        obj.refresh_from_db()
+        self.assertIsNotNone(obj.used_at)